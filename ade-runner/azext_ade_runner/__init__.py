@@ -7,9 +7,6 @@ from azure.cli.core import AzCommandsLoader
 from azure.cli.core.commands import CliCommandType
 
 from ._constants import EXT_DIR_NAME
-from ._help import helps  # pylint: disable=unused-import
-from ._params import load_arguments
-from .commands import load_command_table
 
 
 class AdeRunnerCommandsLoader(AzCommandsLoader):
@@ -19,10 +16,13 @@ class AdeRunnerCommandsLoader(AzCommandsLoader):
         super().__init__(cli_ctx=cli_ctx, custom_command_type=custom_command_type)
 
     def load_command_table(self, args):
+        from ._help import helps  # pylint: disable=unused-import
+        from .commands import load_command_table
         load_command_table(self, args)
         return self.command_table
 
     def load_arguments(self, command):
+        from ._params import load_arguments
         load_arguments(self, command)
 
 
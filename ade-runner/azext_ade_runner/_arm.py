@@ -4,23 +4,51 @@
 # ------------------------------------
 # pylint: disable=logging-fstring-interpolation, protected-access, inconsistent-return-statements, raise-missing-from
 
+import asyncio
 import json
+import os
+import time
 
+from datetime import datetime, timezone
 from pathlib import Path
-from time import sleep
+from typing import Optional
 
 from azure.cli.core.commands import LongRunningOperation
 from azure.cli.core.commands.client_factory import get_subscription_id
 from azure.cli.core.profiles import ResourceType, get_sdk
-from azure.cli.core.util import random_string, sdk_no_wait
+from azure.cli.core.util import random_string
+from azure.core.exceptions import HttpResponseError
 from knack.util import CLIError
 from msrestazure.tools import parse_resource_id, resource_id
 
+from ._cache import cache_key
 from ._client_factory import cf_network, cf_resources
+from ._constants import OUTPUT_DIR, STORAGE_DIR
 from ._logging import get_logger
+from ._metrics import DEPLOYMENTS, RETRIES, inc
+from ._tracing import bind_context, span, traced
+from ._utils import atomic_write
 
 TRIES = 3
 
+# deployments are polled every POLL_INTERVAL_MIN seconds at first, backing off to POLL_INTERVAL_MAX
+POLL_INTERVAL_MIN = 2
+POLL_INTERVAL_MAX = 30
+POLL_BACKOFF = 1.5
+
+TERMINAL_STATES = ('Succeeded', 'Failed', 'Canceled')
+
+# set to 1 to cancel a deployment as soon as one of its operations fails, instead of letting ARM finish
+# the independent resources. Deployments canceled this way are not retried
+ADE_RUNNER_ARM_FAIL_FAST = 'ADE_RUNNER_ARM_FAIL_FAST'
+FAIL_FAST = os.environ.get(ADE_RUNNER_ARM_FAIL_FAST, '0').lower() not in ('0', 'false', '')
+
+# per-resource deployment operations are streamed to this file in the output directory as they change
+OPERATIONS_FILE_NAME = 'deployment-operations.ndjson'
+
+# successful deployment fingerprints and outputs are saved here, one file per resource group and template
+DEPLOYMENTS_DIR_NAME = '.deployments'
+
 log = get_logger(__name__)
 
 
@@ -33,20 +61,269 @@ def is_bicep_file(file_path):
     return file_path.lower().endswith(".bicep")
 
 
-def deploy_arm_template_at_resource_group(cmd, resource_group_name=None, template_file=None,
-                                          template_uri=None, parameters=None, no_wait=False):
-    '''Deploy an ARM template to a resource group.'''
+def get_deployment_fingerprint(subscription_id: str, resource_group_name: str, properties) -> str:
+    '''Get a hash of the compiled template, parameters, mode and target resource group of a deployment'''
+    template = properties.template if isinstance(properties.template, str) \
+        else json.dumps(properties.template, sort_keys=True, separators=(',', ':'))
+    parameters = json.dumps(properties.parameters or {}, sort_keys=True, separators=(',', ':'))
+    return cache_key(subscription_id.lower(), resource_group_name.lower(), properties.mode, template, parameters)
+
+
+def _get_deployment_record_path(subscription_id: str, resource_group_name: str, template: str) -> Path:
+    '''Get the path to the deployment record of a template in a resource group. Catalog items deployed to
+    the same resource group (run-batch) each have their own record'''
+    name = f'{subscription_id.lower()}_{resource_group_name.lower()}_{cache_key(template)[:16]}.json'
+    return STORAGE_DIR / DEPLOYMENTS_DIR_NAME / name
+
+
+def _read_deployment_record(path: Path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_deployment_record(path: Path, record: dict):
+    try:
+        atomic_write(path, json.dumps(record, indent=4, default=str))
+    except OSError as e:
+        log.warning(f'Unable to save deployment fingerprint to {path}: {e}')
+
+
+# ----------------
+# Parameters
+# ----------------
+
+
+def _load_template(cmd, template_file: str = None, template_uri: str = None):
+    '''Get the content (None for a template uri) and parsed object of an ARM or bicep template'''
+    from azure.cli.command_modules.resource.custom import _remove_comments_from_json, _urlretrieve
+    from azure.cli.core.util import read_file_content
+
+    if template_uri:
+        return None, _remove_comments_from_json(_urlretrieve(template_uri).decode('utf-8'), file_path=template_uri)
+
+    if is_bicep_file(template_file):  # not in the compile cache (caching is disabled or bicep isn't installed)
+        from azure.cli.command_modules.resource._bicep import run_bicep_command
+        content = run_bicep_command(cmd.cli_ctx, ['build', '--stdout', template_file])
+        return content, json.loads(content)
+
+    content = read_file_content(template_file)
+    return content, _remove_comments_from_json(content, file_path=template_file)
+
+
+def _resolve_parameter_type(template_obj: dict, declaration: dict) -> str:
+    '''Get the type of a template parameter declaration, following $ref to user defined types'''
+    seen = []
+    while (ref := declaration.get('$ref')) and ref not in seen:
+        seen.append(ref)
+        # e.g. #/definitions/storageConfig
+        node = template_obj
+        for segment in ref.lstrip('#/').split('/'):
+            node = node.get(segment, {}) if isinstance(node, dict) else {}
+        declaration = node
+    return str(declaration.get('type', '')).lower()
+
+
+def _convert_parameter_value(name: str, param_type: str, value):
+    '''Convert a parameter value to the declared type. Values from json keep their type,
+    strings are parsed for non-string types (e.g. ADE_ACTION_PARAMETERS values set as strings)'''
+    from azure.cli.core.azclierror import InvalidArgumentValueError
+    try:
+        if param_type in ('string', 'securestring'):
+            return value if isinstance(value, str) else json.dumps(value)
+        if param_type == 'int':
+            if isinstance(value, bool) or not isinstance(value, (int, str)):
+                raise ValueError(value)
+            return int(value)
+        if param_type == 'bool':
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in ('true', 'false'):
+                return value.lower() == 'true'
+            raise ValueError(value)
+        if param_type in ('object', 'secureobject', 'array'):
+            if isinstance(value, str):
+                value = json.loads(value)
+            if not isinstance(value, list if param_type == 'array' else dict):
+                raise ValueError(value)
+            return value
+    except ValueError as e:
+        raise InvalidArgumentValueError(f"Invalid value for {param_type} parameter '{name}': {value}") from e
+    log.warning(f"Unrecognized type '{param_type}' for parameter '{name}', passing the value as is")
+    return value
+
+
+def build_deployment_parameters(template_obj: dict, values: dict) -> dict:
+    '''Build the deployment parameters object ({name: {value: ...}}) from the action parameters,
+    typed by the template's parameter declarations'''
+    from azure.cli.core.azclierror import InvalidArgumentValueError, RequiredArgumentMissingError
+
+    declarations = template_obj.get('parameters') or {}
+    names = {n.lower(): n for n in declarations}  # parameter names are case insensitive
+    parameters = {}
+
+    for key, value in (values or {}).items():
+        if not (name := names.get(key.lower())):
+            raise InvalidArgumentValueError(f"Unrecognized template parameter '{key}'. "
+                                            f"Allowed parameters: {', '.join(sorted(declarations))}")
+        param_type = _resolve_parameter_type(template_obj, declarations[name])
+        if isinstance(value, dict) and value.keys() == {'reference'} and param_type in ('securestring', 'secureobject'):
+            parameters[name] = value  # a key vault reference
+            continue
+        parameters[name] = {'value': _convert_parameter_value(name, param_type, value)}
+
+    if (missing := sorted(n for n, d in declarations.items() if n not in parameters and 'defaultValue' not in d
+                          and not d.get('nullable'))):
+        raise RequiredArgumentMissingError(f"Missing input parameters: {', '.join(missing)}")
+
+    return parameters
+
 
-    from azure.cli.command_modules.resource.custom import JsonCTemplatePolicy, _prepare_deployment_properties_unmodified
+def _prepare_deployment_properties(cmd, template_file: str = None, template_uri: str = None, parameters: dict = None,
+                                   mode: str = 'Incremental'):
+    '''Build the deployment properties for a template and a dict of parameter values'''
+    DeploymentProperties, TemplateLink = cmd.get_models('DeploymentProperties', 'TemplateLink',
+                                                        resource_type=ResourceType.MGMT_RESOURCE_RESOURCES)
+
+    content, template_obj = _load_template(cmd, template_file=template_file, template_uri=template_uri)
+
+    return DeploymentProperties(template=content, template_link=TemplateLink(uri=template_uri) if template_uri else None,
+                                parameters=build_deployment_parameters(template_obj, parameters), mode=mode)
+
+
+def deploy_arm_template_at_resource_group(cmd, resource_group_name=None, template_file=None,
+                                          template_uri=None, parameters=None, no_wait=False,
+                                          skip_unchanged=False, verify_resource_group=False, on_event=None):
+    '''Deploy an ARM template to a resource group.
+    If skip_unchanged is True and the template, parameters and resource group match the last successful
+    deployment, the deployment is skipped and the saved outputs are returned.'''
+    if no_wait:
+        deployment = _prepare_deployment(cmd, resource_group_name, template_file=template_file,
+                                         template_uri=template_uri, parameters=parameters)
+        _begin_deployment(cmd, deployment, try_number=0)
+        return None, None
+
+    return asyncio.run(deploy_arm_template_at_resource_group_async(
+        cmd, resource_group_name, template_file=template_file, template_uri=template_uri, parameters=parameters,
+        skip_unchanged=skip_unchanged, verify_resource_group=verify_resource_group, on_event=on_event))
+
+
+async def deploy_arm_template_at_resource_group_async(cmd, resource_group_name=None, template_file=None,
+                                                      template_uri=None, parameters=None, skip_unchanged=False,
+                                                      verify_resource_group=False, on_event=None):
+    '''Deploy an ARM template to a resource group without blocking the event loop while it waits,
+    so several deployments can be awaited concurrently.'''
+    template = template_file or template_uri
+    runner = 'Bicep' if template_file and is_bicep_file(str(template_file)) else 'ARM'
+    with span('arm.deploy', resourceGroup=resource_group_name, template=template, runner=runner) as deploy_span:
+        try:
+            loop = asyncio.get_running_loop()
+
+            deployment = await loop.run_in_executor(None, bind_context(
+                _prepare_deployment, cmd, resource_group_name, template_file=template_file, template_uri=template_uri,
+                parameters=parameters, skip_unchanged=skip_unchanged, verify_resource_group=verify_resource_group))
+
+            if deployment.skipped:
+                deploy_span.set(skipped=True)
+                inc(DEPLOYMENTS, runner=runner, outcome='skipped')
+                return None, deployment.outputs
+
+            for try_number in range(TRIES):
+                deploy_span.set(tries=try_number + 1)
+                try:
+                    deployment_name, retry_after = await loop.run_in_executor(None, bind_context(
+                        _begin_deployment, cmd, deployment, try_number))
+
+                    result = await poll_deployment(deployment.client, resource_group_name, deployment_name,
+                                                   on_event=on_event, try_number=try_number,
+                                                   operations_client=deployment.operations_client,
+                                                   retry_after=retry_after)
+
+                    props = getattr(result, 'properties', None)
+                    outputs = getattr(props, 'outputs', None)
+
+                    _write_deployment_record(deployment.record_path, {
+                        'fingerprint': deployment.fingerprint,
+                        'deploymentName': deployment_name,
+                        'subscriptionId': deployment.subscription_id,
+                        'resourceGroup': resource_group_name,
+                        'timestamp': datetime.now(timezone.utc).isoformat(),
+                        'outputs': outputs
+                    })
+
+                    inc(DEPLOYMENTS, runner=runner, outcome='succeeded')
+                    return result, outputs
+                except (CLIError, HttpResponseError) as err:
+                    # a deployment that failed fast was canceled, retrying would deploy it again
+                    if try_number == TRIES - 1 or isinstance(err, _FailedFastError) or not _is_service_unavailable(err):
+                        raise
+                    inc(RETRIES, operation='arm.deploy', reason='ServiceUnavailable')
+                    log.info(f'Deployment failed with ServiceUnavailable, retrying ({try_number + 1}/{TRIES - 1})')
+                    await asyncio.sleep(5)
+        except BaseException:  # count every failure once, not only the last try's error
+            inc(DEPLOYMENTS, runner=runner, outcome='failed')
+            raise
+
+
+class _FailedFastError(CLIError):
+    '''A deployment was canceled because one of its operations failed'''
+
+
+class _Deployment:  # pylint: disable=too-few-public-methods
+    '''A prepared deployment'''
+
+    def __init__(self, **kwargs):
+        self.client = kwargs.get('client')
+        self.operations_client = kwargs.get('operations_client')
+        self.resource_group_name = kwargs.get('resource_group_name')
+        self.properties = kwargs.get('properties')
+        self.subscription_id = kwargs.get('subscription_id')
+        self.fingerprint = kwargs.get('fingerprint')
+        self.record_path = kwargs.get('record_path')
+        self.skipped = kwargs.get('skipped', False)
+        self.outputs = kwargs.get('outputs')
+
+
+@traced('arm.prepare')
+def _prepare_deployment(cmd, resource_group_name, template_file=None, template_uri=None, parameters=None,
+                        skip_unchanged=False, verify_resource_group=False) -> _Deployment:
+    '''Compile the template and parameters, and check them against the last successful deployment'''
+
+    from azure.cli.command_modules.resource.custom import JsonCTemplatePolicy
+
+    # the catalog item's template (not the compiled bicep file) identifies the deployment record
+    template = str(Path(template_file).resolve()) if template_file else template_uri
+
+    if template_file and is_bicep_file(str(template_file)):
+        from ._bicep import build_bicep_file
+        compiled_file, _ = build_bicep_file(cmd.cli_ctx, Path(template_file))
+        if compiled_file:  # deploy the cached ARM template instead of compiling the bicep file again
+            template_file = compiled_file
 
     if template_file and isinstance(template_file, Path):
         template_file = str(template_file)
 
-    properties = _prepare_deployment_properties_unmodified(cmd, 'resourceGroup', template_file=template_file,
-                                                           template_uri=template_uri, parameters=parameters,
-                                                           mode='Incremental')
+    properties = _prepare_deployment_properties(cmd, template_file=template_file, template_uri=template_uri,
+                                                parameters=parameters, mode='Incremental')
+
+    subscription_id = get_subscription_id(cmd.cli_ctx)
+    fingerprint = get_deployment_fingerprint(subscription_id, resource_group_name, properties)
+    record_path = _get_deployment_record_path(subscription_id, resource_group_name, template)
+
+    if skip_unchanged and (record := _read_deployment_record(record_path)) \
+            and record.get('fingerprint') == fingerprint:
+        if not verify_resource_group or resource_group_exists(cmd.cli_ctx, resource_group_name):
+            log.info(f"Template and parameters are unchanged since deployment {record.get('deploymentName')}, "
+                     'skipping deployment')
+            return _Deployment(skipped=True, outputs=record.get('outputs'))
+        log.info(f'Resource group {resource_group_name} no longer exists, deploying')
+
+    # the resources may change even if this deployment fails, so forget the last successful fingerprint
+    record_path.unlink(missing_ok=True)
+
     smc = cf_resources(cmd.cli_ctx)
-    client = smc.deployments
 
     if template_file:
         # Plug this as default HTTP pipeline
@@ -58,33 +335,232 @@ def deploy_arm_template_at_resource_group(cmd, resource_group_name=None, templat
             transport=smc._client._pipeline._transport
         )
 
-    for try_number in range(TRIES):
+    return _Deployment(client=smc.deployments, operations_client=smc.deployment_operations,
+                       resource_group_name=resource_group_name, properties=properties,
+                       subscription_id=subscription_id, fingerprint=fingerprint, record_path=record_path)
+
+
+def _begin_deployment(cmd, deployment: _Deployment, try_number: int):
+    '''Submit a deployment without waiting for it. Returns the deployment name and the Retry-After header
+    of the response, if any'''
+    deployment_name = random_string(length=14, force_lower=True) + str(try_number)
+
+    Deployment = cmd.get_models('Deployment', resource_type=ResourceType.MGMT_RESOURCE_RESOURCES)
+
+    # polling=False returns as soon as ARM accepts the deployment, poll_deployment does the waiting
+    with span('arm.submit', deployment=deployment_name, tryNumber=try_number):
+        poller = deployment.client.begin_create_or_update(
+            deployment.resource_group_name, deployment_name, Deployment(properties=deployment.properties),
+            polling=False, cls=lambda response, deserialized, headers: _get_retry_after(response))
+
+    return deployment_name, poller.result()
+
+
+def _is_service_unavailable(err) -> bool:
+    '''Returns True if a deployment failed because a resource provider was unavailable'''
+    if '(ServiceUnavailable)' in str(err):
+        return True
+    try:
+        response = getattr(err, 'response', None)
+        text = response.text() if callable(response.text) else response.text
+        return '(ServiceUnavailable)' in json.loads(text)['error']['details'][0]['message']
+    except Exception:  # pylint: disable=broad-except
+        return False
+
+
+def _log_event(event: dict):
+    log.info(json.dumps(event))
+
+
+def _get_retry_after(response) -> Optional[float]:
+    '''Get the Retry-After header (seconds) of a pipeline response. The generated operations pass
+    an empty headers dict to cls, so it's read from the http response'''
+    try:
+        return float(response.http_response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _get_deployment(client, resource_group_name: str, deployment_name: str):
+    '''Get a deployment and the Retry-After header of the response, if any'''
+    return client.get(resource_group_name, deployment_name,
+                      cls=lambda response, deserialized, headers: (deserialized, _get_retry_after(response)))
+
+
+def _get_deployment_error(deployment) -> str:
+    error = getattr(getattr(deployment, 'properties', None), 'error', None)
+    if not error:
+        return 'No error details were provided'
+    messages = [f'({error.code}) {error.message}']
+    messages.extend(f'({d.code}) {d.message}' for d in (error.details or []))
+    return '\n'.join(messages)
+
+
+def _get_status_message(status_message) -> str:
+    '''Format the status message of a failed deployment operation like ARM's deployment errors'''
+    if not status_message:
+        return None
+    error = getattr(status_message, 'error', None)
+    if error is None and isinstance(getattr(status_message, 'status', None), dict):
+        error = status_message.status.get('error')
+    if isinstance(error, dict):
+        messages = [f"({error.get('code')}) {error.get('message')}"]
+        messages.extend(f"({d.get('code')}) {d.get('message')}" for d in (error.get('details') or []))
+        return '\n'.join(messages)
+    if error is not None:
+        messages = [f'({error.code}) {error.message}']
+        messages.extend(f'({d.code}) {d.message}' for d in (error.details or []))
+        return '\n'.join(messages)
+    return str(getattr(status_message, 'status', status_message))
+
+
+class DeploymentOperationTracker:
+    '''Tracks the per-resource operations of a deployment between polls and streams the
+    operations that changed since the last poll as NDJSON to the output directory and the log'''
+
+    def __init__(self, client, resource_group_name: str, deployment_name: str, output_file: Path = None):
+        self.client = client
+        self.resource_group_name = resource_group_name
+        self.deployment_name = deployment_name
+        self.output_file = output_file or OUTPUT_DIR / OPERATIONS_FILE_NAME
+        self.operations = {}  # operation id: (provisioning state, timestamp)
+        self.failed = []
+
+    def poll(self) -> list:
+        '''List the deployment's operations and return records for those whose state changed since the last poll.
+        This blocks, call it from an executor.'''
+        changed = []
+        # ARM has no filter for changed operations, but the list is only walked once
+        # per poll and only the changed operations are recorded and written
+        for op in self.client.list(self.resource_group_name, self.deployment_name):
+            props = op.properties
+            state = (props.provisioning_state, str(props.timestamp))
+            if self.operations.get(op.operation_id) == state:
+                continue
+            self.operations[op.operation_id] = state
+
+            target = props.target_resource
+            record = {
+                'timestamp': props.timestamp.isoformat() if props.timestamp else None,
+                'deployment': self.deployment_name,
+                'resourceGroup': self.resource_group_name,
+                'operationId': op.operation_id,
+                'operation': props.provisioning_operation,
+                'resourceType': getattr(target, 'resource_type', None),
+                'resourceName': getattr(target, 'resource_name', None),
+                'resourceId': getattr(target, 'id', None),
+                'provisioningState': props.provisioning_state,
+                'duration': props.duration,
+                'statusCode': props.status_code,
+                'error': _get_status_message(props.status_message) if props.provisioning_state == 'Failed' else None
+            }
+            if record['provisioningState'] == 'Failed':
+                self.failed.append(record)
+            changed.append(record)
+
+        return changed
+
+    def write(self, records: list):
+        '''Append records to the operations file and the log'''
+        for record in records:
+            log.info(f"{record['resourceType']}/{record['resourceName']} ({record['operation']}): "
+                     f"{record['provisioningState']} {record['duration'] or ''}".rstrip())
         try:
-            deployment_name = random_string(length=14, force_lower=True) + str(try_number)
-
-            Deployment = cmd.get_models('Deployment', resource_type=ResourceType.MGMT_RESOURCE_RESOURCES)
-            deployment = Deployment(properties=properties)
-
-            deploy_poll = sdk_no_wait(no_wait, client.begin_create_or_update, resource_group_name,
-                                      deployment_name, deployment)
-
-            result = LongRunningOperation(cmd.cli_ctx, start_msg='Deploying ARM template',
-                                          finish_msg='Finished deploying ARM template')(deploy_poll)
-
-            props = getattr(result, 'properties', None)
-            return result, getattr(props, 'outputs', None)
-        except CLIError as err:
-            if try_number == TRIES - 1:
-                raise err
-            try:
-                response = getattr(err, 'response', None)
-                message = json.loads(response.text)['error']['details'][0]['message']
-                if '(ServiceUnavailable)' not in message:
-                    raise err
-            except:
-                raise err from err
-            sleep(5)
-            continue
+            self.output_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.output_file, 'a', encoding='utf-8') as f:
+                f.writelines(json.dumps(r, default=str) + '\n' for r in records)
+        except OSError as e:
+            log.warning(f'Unable to write deployment operations to {self.output_file}: {e}')
+
+
+@traced('arm.poll')
+async def poll_deployment(client, resource_group_name: str, deployment_name: str, on_event=None, try_number: int = 0,
+                          operations_client=None, fail_fast: bool = None, retry_after: float = None):
+    '''Wait for a deployment to finish. Polls quickly at first and backs off to POLL_INTERVAL_MAX,
+    honoring Retry-After, and emits a progress event (dict) to on_event for each poll. retry_after is the
+    Retry-After of the response that submitted the deployment, the first poll waits for it.
+    If operations_client is provided, the deployment's operations are streamed as they change and, if fail_fast
+    is True (ADE_RUNNER_ARM_FAIL_FAST by default), the deployment is canceled as soon as any operation fails.'''
+    emit = on_event or _log_event
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    interval = POLL_INTERVAL_MIN
+    fail_fast = FAIL_FAST if fail_fast is None else fail_fast
+
+    def _event(name: str, state: str = None, **kwargs):
+        emit({'event': name, 'deployment': deployment_name, 'resourceGroup': resource_group_name, 'try': try_number,
+              'state': state, 'elapsed': round(time.monotonic() - start, 2), **kwargs})
+
+    tracker = DeploymentOperationTracker(operations_client, resource_group_name, deployment_name) \
+        if operations_client else None
+
+    async def _track_operations():
+        if not tracker:
+            return
+        try:
+            changed = await loop.run_in_executor(None, bind_context(tracker.poll))
+        except HttpResponseError as e:  # operations are informational, don't fail the deployment
+            log.warning(f'Unable to list operations for deployment {deployment_name}: {e}')
+            return
+        if changed:
+            tracker.write(changed)
+            _event('deployment.operations', changed=len(changed), operations=len(tracker.operations))
+
+    _event('deployment.started', 'Accepted')
+
+    if retry_after:
+        await asyncio.sleep(retry_after)
+
+    while True:
+        deployment, retry_after = await loop.run_in_executor(None, bind_context(_get_deployment, client,
+                                                                                resource_group_name, deployment_name))
+        state = getattr(deployment.properties, 'provisioning_state', None)
+
+        await _track_operations()
+
+        if state in TERMINAL_STATES:
+            break
+
+        if fail_fast and tracker and tracker.failed:
+            error = '\n'.join(f"{r['resourceType']}/{r['resourceName']}: {r['error']}" for r in tracker.failed)
+            # cancel the deployment and wait for it to stop, so a retry doesn't deploy the same resources
+            # while this deployment is still deploying them
+            state = await _cancel_deployment(client, resource_group_name, deployment_name)
+            _event('deployment.failed', state, error=error)
+            raise _FailedFastError(f'Deployment {deployment_name} failed and was canceled:\n{error}')
+
+        wait = max(interval, retry_after or 0)
+        _event('deployment.progress', state, nextPoll=round(wait, 2))
+        await asyncio.sleep(wait)
+        interval = min(POLL_INTERVAL_MAX, interval * POLL_BACKOFF)
+
+    if state != 'Succeeded':
+        error = _get_deployment_error(deployment)
+        _event('deployment.failed', state, error=error)
+        raise CLIError(f'Deployment {deployment_name} {state.lower()}:\n{error}')
+
+    _event('deployment.succeeded', state)
+    return deployment
+
+
+@traced('arm.cancel')
+async def _cancel_deployment(client, resource_group_name: str, deployment_name: str) -> str:
+    '''Cancel a running deployment and wait for it to reach a terminal state. Returns the state'''
+    loop = asyncio.get_running_loop()
+    log.info(f'Canceling deployment {deployment_name}')
+    try:
+        await loop.run_in_executor(None, bind_context(client.cancel, resource_group_name, deployment_name))
+    except HttpResponseError as e:  # the deployment finished since it was polled
+        log.info(f'Unable to cancel deployment {deployment_name}: {e}')
+
+    interval = POLL_INTERVAL_MIN
+    while True:
+        deployment, retry_after = await loop.run_in_executor(None, bind_context(_get_deployment, client,
+                                                                                resource_group_name, deployment_name))
+        if (state := getattr(deployment.properties, 'provisioning_state', None)) in TERMINAL_STATES:
+            return state
+        await asyncio.sleep(max(interval, retry_after or 0))
+        interval = min(POLL_INTERVAL_MAX, interval * POLL_BACKOFF)
 
 
 def get_arm_output(outputs, key, raise_on_error=True):
@@ -152,6 +628,11 @@ def get_resource_group_tags(cmd, resource_group_name):
     return result.properties.tags
 
 
+def resource_group_exists(cli_ctx, resource_group_name) -> bool:
+    '''Checks if a resource group exists.'''
+    return cf_resources(cli_ctx).resource_groups.check_existence(resource_group_name)
+
+
 def get_resource_group_by_name(cli_ctx, resource_group_name):
     subscription_id = get_subscription_id(cli_ctx)
     try:
@@ -0,0 +1,123 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation, protected-access
+
+import hashlib
+import os
+import platform
+import re
+import shutil
+
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from ._cache import CACHE_DISABLED, cache_key, read_cache_file, write_cache_file
+from ._logging import get_logger
+from ._tracing import span
+
+BICEP_CACHE = 'bicep'
+BICEP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# local files referenced by a bicep file are compiled into its ARM template
+_MODULE_PATTERN = re.compile(r"^\s*module\s+\w+\s+'([^']+)'", re.MULTILINE)
+_IMPORT_PATTERN = re.compile(r"^\s*import\s+[^\n]*?\bfrom\s+'([^']+)'", re.MULTILINE)
+_LOAD_PATTERN = re.compile(r"\bload(?:TextContent|FileAsBase64|JsonContent|YamlContent)\(\s*'([^']+)'")
+
+log = get_logger(__name__)
+
+
+def _is_external_reference(ref: str) -> bool:
+    '''Returns True for registry (br:, br/alias:) and template spec (ts:, ts/alias:) references'''
+    scheme = ref.split(':', 1)[0] if ':' in ref else None
+    return scheme is not None and (scheme in ('br', 'ts') or scheme.startswith(('br/', 'ts/')))
+
+
+def get_bicep_dependencies(template_file: Path) -> Tuple[List[Path], List[str]]:
+    '''Get the bicep file and all the local files it references transitively (modules, imports and loaded
+    content), and the registry and template spec references that can not be hashed locally'''
+    entry = template_file.resolve()
+    files, external = [], []
+    pending = [entry]
+
+    while pending:
+        file = pending.pop()
+        if file in files:
+            continue
+        files.append(file)
+
+        if file.suffix.lower() != '.bicep' or not file.is_file():
+            continue
+
+        content = file.read_text(encoding='utf-8')
+        refs = _MODULE_PATTERN.findall(content) + _IMPORT_PATTERN.findall(content) + _LOAD_PATTERN.findall(content)
+
+        for ref in refs:
+            if _is_external_reference(ref):
+                if ref not in external:
+                    external.append(ref)
+            else:
+                pending.append((file.parent / ref).resolve())
+
+    return files, external
+
+
+def _hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+    except OSError:
+        return 'missing'
+    return h.hexdigest()
+
+
+def _get_bicep_executable(cli_ctx) -> Optional[str]:
+    '''Get the path to the bicep executable az uses, or None if it is not installed'''
+    from azure.cli.command_modules.resource._bicep import _get_bicep_installation_path
+    try:
+        from azure.cli.command_modules.resource._bicep import _use_binary_from_path
+        use_binary_from_path = _use_binary_from_path(cli_ctx)
+    except ImportError:
+        use_binary_from_path = False
+
+    bicep = shutil.which('bicep') if use_binary_from_path else _get_bicep_installation_path(platform.system())
+    return bicep if bicep and os.path.isfile(bicep) else None
+
+
+def get_bicep_cache_key(cli_ctx, template_file: Path) -> Optional[str]:
+    '''Get the compile cache key for a bicep file from the hash of the file, all of the files it
+    references, and the bicep executable. Returns None if bicep is not installed.'''
+    if not (bicep := _get_bicep_executable(cli_ctx)):
+        return None
+
+    # the executable's size and modified time stand in for its version,
+    # running bicep --version would cost as much as the build we're skipping
+    stat = os.stat(bicep)
+    files, external = get_bicep_dependencies(template_file)
+    root = template_file.resolve().parent
+
+    return cache_key(f'{bicep}:{stat.st_size}:{stat.st_mtime_ns}', *external,
+                     *(f'{os.path.relpath(f, root)}:{_hash_file(f)}' for f in files))
+
+
+def build_bicep_file(cli_ctx, template_file: Path) -> Tuple[Optional[Path], bool]:
+    '''Compile a bicep file to an ARM template using the compile cache.
+    Returns the path to the cached ARM template and whether it was already in the cache.
+    Returns None for the path if caching is disabled or bicep is not installed.'''
+    if CACHE_DISABLED or not (key := get_bicep_cache_key(cli_ctx, template_file)):
+        return None, False
+
+    if (cached := read_cache_file(BICEP_CACHE, key, '.json')):
+        log.info(f'Using cached ARM template for {template_file}')
+        return cached, True
+
+    from azure.cli.command_modules.resource._bicep import run_bicep_command
+
+    log.info(f'Compiling {template_file}')
+    with span('bicep.build', template=template_file):
+        template = run_bicep_command(cli_ctx, ['build', '--stdout', str(template_file)])
+
+    return write_cache_file(BICEP_CACHE, key, template, '.json', max_bytes=BICEP_CACHE_MAX_BYTES), False
@@ -0,0 +1,255 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import atexit
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from pathlib import Path
+from typing import Optional, Union
+
+from ._constants import STORAGE_DIR
+from ._logging import get_logger
+from ._utils import atomic_write
+
+CACHE_DIR_NAME = '.cache'
+STATS_FILE_NAME = '.stats.json'
+
+# set to any value to disable all caches
+ADE_RUNNER_NO_CACHE = 'ADE_RUNNER_NO_CACHE'
+
+CACHE_DISABLED = bool(os.environ.get(ADE_RUNNER_NO_CACHE))
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+log = get_logger(__name__)
+
+_lock = threading.Lock()
+_stats = {}  # cache dir -> {'hits': int, 'misses': int}
+_written = {}  # cache dir -> bytes written since the last eviction
+
+
+def get_cache_root() -> Path:
+    return STORAGE_DIR / CACHE_DIR_NAME
+
+
+def get_cache_dir(name: str, root: Path = None) -> Path:
+    return (root or get_cache_root()) / name
+
+
+def cache_key(*parts) -> str:
+    '''Get a cache key from the hash of one or more strings or bytes'''
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part, bytes) else str(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+def read_cache(name: str, key: str, root: Path = None) -> Optional[dict]:
+    '''Read a cache entry. Returns None if the entry does not exist or caching is disabled'''
+    if CACHE_DISABLED:
+        return None
+
+    cache_dir = get_cache_dir(name, root)
+    entry_path = cache_dir / f'{key}.json'
+
+    try:
+        with open(entry_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        _record(cache_dir, hit=False)
+        return None
+
+    try:  # touch the entry so least recently used entries are evicted first
+        os.utime(entry_path)
+    except OSError:
+        pass
+
+    _record(cache_dir, hit=True)
+    return entry
+
+
+def write_cache(name: str, key: str, entry: dict, root: Path = None, max_bytes: int = DEFAULT_MAX_BYTES) -> bool:
+    '''Write a cache entry and evict least recently used entries if the cache exceeds max_bytes'''
+    if CACHE_DISABLED:
+        return False
+
+    cache_dir = get_cache_dir(name, root)
+
+    try:
+        data = json.dumps(entry, ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        log.info(f'Unable to serialize {name} cache entry {key}: {e}')
+        return False
+
+    try:
+        atomic_write(cache_dir / f'{key}.json', data)
+    except OSError as e:
+        log.info(f'Unable to write {name} cache entry {key}: {e}')
+        return False
+
+    with _lock:
+        # only scan the cache directory on the first write in the process or
+        # once this process alone has written enough to exceed the max size
+        written = _written.get(cache_dir)
+        _written[cache_dir] = (written or 0) + len(data)
+        evict = written is None or _written[cache_dir] > max_bytes
+
+    if evict:
+        evict_cache(name, root=root, max_bytes=max_bytes)
+
+    return True
+
+
+def read_cache_file(name: str, key: str, suffix: str, root: Path = None) -> Optional[Path]:
+    '''Get the path to a cached file. Returns None if the file does not exist or caching is disabled'''
+    if CACHE_DISABLED:
+        return None
+
+    cache_dir = get_cache_dir(name, root)
+    cache_file = cache_dir / f'{key}{suffix}'
+
+    try:  # touch the file so least recently used files are evicted first
+        os.utime(cache_file)
+    except OSError:
+        _record(cache_dir, hit=False)
+        return None
+
+    _record(cache_dir, hit=True)
+    return cache_file
+
+
+def write_cache_file(name: str, key: str, data: Union[str, bytes], suffix: str, root: Path = None,
+                     max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[Path]:
+    '''Write a file to a cache. Returns the path to the cached file, or None if it could not be written'''
+    if CACHE_DISABLED:
+        return None
+
+    cache_file = get_cache_dir(name, root) / f'{key}{suffix}'
+
+    try:
+        atomic_write(cache_file, data)
+    except OSError as e:
+        log.info(f'Unable to write {name} cache file {key}: {e}')
+        return None
+
+    evict_cache(name, root=root, max_bytes=max_bytes)
+
+    return cache_file if cache_file.is_file() else None
+
+
+def evict_cache(name: str, root: Path = None, max_bytes: int = DEFAULT_MAX_BYTES) -> int:
+    '''Remove least recently used entries until the cache is smaller than max_bytes.
+    Returns the number of entries removed.'''
+    cache_dir = get_cache_dir(name, root)
+    entries = _get_entries(cache_dir)
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+
+    for path, size, _ in sorted(entries, key=lambda e: e[2]):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+
+    if removed:
+        log.info(f'Evicted {removed} entries from {name} cache')
+
+    with _lock:
+        _written[cache_dir] = 0
+
+    return removed
+
+
+def get_cache_stats(name: str = None, root: Path = None) -> list:
+    '''Get the number of entries, size, hits and misses for one or all caches'''
+    _flush_stats()
+
+    cache_root = root or get_cache_root()
+    if name:
+        names = [name]
+    elif cache_root.is_dir():
+        names = sorted(p.name for p in cache_root.iterdir() if p.is_dir())
+    else:
+        names = []
+
+    stats = []
+    for n in names:
+        cache_dir = get_cache_dir(n, root)
+        entries = _get_entries(cache_dir)
+        counts = _read_stats(cache_dir)
+        stats.append({
+            'name': n,
+            'path': str(cache_dir),
+            'entries': len(entries),
+            'size': sum(size for _, size, _ in entries),
+            'hits': counts.get('hits', 0),
+            'misses': counts.get('misses', 0)
+        })
+    return stats
+
+
+def purge_cache(name: str = None, root: Path = None):
+    '''Delete one or all caches'''
+    cache_dir = get_cache_dir(name, root) if name else (root or get_cache_root())
+    if cache_dir.is_dir():
+        log.info(f'Deleting cache directory: {cache_dir}')
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+def _get_entries(cache_dir: Path) -> list:
+    entries = []
+    try:
+        with os.scandir(cache_dir) as s:
+            for e in s:
+                if e.is_file() and not e.name.startswith('.'):
+                    st = e.stat()
+                    entries.append((Path(e.path), st.st_size, st.st_mtime))
+    except OSError:
+        pass
+    return entries
+
+
+def _record(cache_dir: Path, hit: bool):
+    with _lock:
+        counts = _stats.setdefault(cache_dir, {'hits': 0, 'misses': 0})
+        counts['hits' if hit else 'misses'] += 1
+
+
+def _read_stats(cache_dir: Path) -> dict:
+    try:
+        with open(cache_dir / STATS_FILE_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@atexit.register
+def _flush_stats():
+    '''Add the hits and misses recorded by this process to the persisted counts (best effort)'''
+    with _lock:
+        pending = {k: v for k, v in _stats.items() if v['hits'] or v['misses']}
+        _stats.clear()
+
+    for cache_dir, counts in pending.items():
+        if not cache_dir.is_dir():
+            continue
+        persisted = _read_stats(cache_dir)
+        for k, v in counts.items():
+            persisted[k] = persisted.get(k, 0) + v
+        try:
+            atomic_write(cache_dir / STATS_FILE_NAME, json.dumps(persisted))
+        except OSError:
+            pass
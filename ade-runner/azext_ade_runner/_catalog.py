@@ -0,0 +1,255 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import time
+
+from pathlib import Path
+from typing import Callable, List, Optional, Union
+
+from azure.cli.core.azclierror import ArgumentUsageError, InvalidArgumentValueError, ValidationError
+
+from ._cache import cache_key, read_cache, write_cache
+from ._data import Manifest, get_schema_hash
+from ._logging import get_logger
+from ._tracing import traced
+from ._utils import get_extension_version, get_yaml_file_contents, get_yaml_file_path
+
+MANIFEST_NAME = 'manifest'
+MANIFEST_CACHE = 'manifests'
+MANIFEST_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+log = get_logger(__name__)
+
+
+def is_catalog_item(path: Path) -> bool:
+    '''Returns True if the path is a directory that contains a manifest.yaml or manifest.yml file'''
+    return path.is_dir() and ((path / f'{MANIFEST_NAME}.yaml').is_file() or (path / f'{MANIFEST_NAME}.yml').is_file())
+
+
+def get_catalog_items(catalog: Union[str, Path], patterns: List[str] = None) -> List[Path]:
+    '''Get the paths to all catalog items in a catalog.
+    patterns can be catalog item names, paths, or glob patterns relative to the catalog.
+    If no patterns are provided, all catalog items in the catalog are returned.'''
+    catalog = (catalog if isinstance(catalog, Path) else Path(catalog)).resolve()
+
+    items = []
+
+    if not patterns:
+        for manifest in sorted(catalog.glob(f'**/{MANIFEST_NAME}.y*ml')):
+            if manifest.suffix in ('.yaml', '.yml') and manifest.parent not in items:
+                items.append(manifest.parent)
+        return items
+
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_absolute():
+            matches = [path.resolve()]
+        else:
+            matches = sorted(p.resolve() for p in catalog.glob(pattern))
+            if not matches and path.is_dir():  # fall back to a path relative to the current directory
+                matches = [path.resolve()]
+
+        matches = [m for m in matches if is_catalog_item(m)]
+
+        if not matches:
+            raise InvalidArgumentValueError(f'No catalog items found matching: {pattern}',
+                                            recommendation='Provide catalog item names, paths, or glob patterns '
+                                            'relative to the catalog for directories containing a manifest.yaml')
+
+        for match in matches:
+            if match not in items:
+                items.append(match)
+
+    return items
+
+
+@traced('manifest.load')
+def get_manifest(catalog_item: Path) -> Manifest:
+    '''Load and validate the manifest for a catalog item.
+    Validated manifests are cached by path, modified time and size so unchanged manifests are not parsed again.
+    Cached manifests aren't validated again, so the key includes the extension version and manifest schema.'''
+    key = cache_key(catalog_item, get_extension_version(), get_schema_hash(Manifest))
+
+    if (entry := read_cache(MANIFEST_CACHE, key)):
+        yaml_path = Path(entry['file'])
+        # a manifest.yml added next to a cached manifest.yaml (or the reverse) is an error get_yaml_file_path reports
+        sibling = yaml_path.with_suffix('.yml' if yaml_path.suffix == '.yaml' else '.yaml')
+        try:
+            stat = yaml_path.stat()
+        except OSError:
+            stat = None
+        if stat and stat.st_mtime_ns == entry['mtime'] and stat.st_size == entry['size'] and not sibling.exists():
+            log.info(f'Using cached manifest for {catalog_item}')
+            return Manifest(entry['manifest'], yaml_path, validate=False)
+
+    yaml_path = get_yaml_file_path(catalog_item, MANIFEST_NAME, required=True)
+    stat = yaml_path.stat()
+    yaml_content = get_yaml_file_contents(yaml_path)
+    # copy the parsed yaml before Manifest adds the file path
+    manifest_obj = dict(yaml_content) if isinstance(yaml_content, dict) else None
+
+    manifest = Manifest(yaml_content, yaml_path)
+    if manifest_obj:  # keep the values validation converted (e.g. version: 1.0 to a string)
+        manifest_obj.update((k, yaml_content[k]) for k in manifest_obj)
+
+    write_cache(MANIFEST_CACHE, key, {
+        'file': str(yaml_path),
+        'mtime': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'manifest': manifest_obj
+    }, max_bytes=MANIFEST_CACHE_MAX_BYTES)
+
+    return manifest
+
+
+def validate_manifest_runner(manifest: Manifest):
+    '''Validate the template file extension matches the runner'''
+    runner: str = manifest.runner
+    template_path: Path = manifest.template_path
+
+    if runner:  # if runner is specified, validate template_path is the correct type for the runner
+        if runner.lower() == 'arm' or runner.lower() == 'bicep':
+            if template_path.suffix != '.json' and template_path.suffix != '.bicep':
+                raise ArgumentUsageError(f'Invalid template file for {runner} runner: {template_path}',
+                                         recommendation='Please provide a valid ARM/Bicep template '
+                                         'file with .json or .bicep extension')
+        elif runner.lower() == 'terraform' or runner.lower() == 'tf':
+            if template_path.suffix != '.tf':
+                raise ArgumentUsageError(f'Invalid template file for {runner} runner: {template_path}',
+                                         recommendation='Please provide a valid Terraform template '
+                                         'file with .tf extension')
+        else:
+            raise ArgumentUsageError(f'Invalid runner: {runner}',
+                                     recommendation='Please provide a valid runner: ARM, Bicep, or Terraform')
+
+    elif template_path:  # if template_path is specified, validate runner is the correct type for the template_path
+        if template_path.suffix == '.tf' or str(template_path).lower().endswith('.tf.json'):
+            runner = 'Terraform'
+        elif template_path.suffix == '.bicep':
+            runner = 'Bicep'
+        elif template_path.suffix == '.json':
+            runner = 'ARM'
+        else:
+            raise ArgumentUsageError(f'Invalid template file: {template_path}',
+                                     recommendation='Please provide a valid ARM/Bicep/Terraform template '
+                                     'file with .json/.bicep/.tf extension')
+
+    # TODO: Add validation for other runners
+
+
+def get_runner_type(manifest: Manifest) -> Optional[str]:
+    '''Get the runner type (ARM, Bicep or Terraform) of a catalog item from its runner and template file.
+    ARM catalog items with a bicep template are Bicep'''
+    runner = (manifest.runner or '').lower()
+    template = str(manifest.template_path or '').lower()
+
+    if runner in ('terraform', 'tf') or template.endswith('.tf') or template.endswith('.tf.json'):
+        return 'Terraform'
+    if runner == 'bicep' or template.endswith('.bicep'):
+        return 'Bicep'
+    if runner == 'arm' or template.endswith('.json'):
+        return 'ARM'
+    return None
+
+
+# ----------------
+# Validation
+# ----------------
+
+_cli = None  # the cli used by validation workers to compile bicep
+
+
+def _get_cli():
+    global _cli  # pylint: disable=global-statement
+    if _cli is None:
+        from azure.cli.core import get_default_cli
+        _cli = get_default_cli()
+    return _cli
+
+
+class _Skipped(Exception):
+    '''Raised by a validation check that doesn't apply or can't run'''
+
+
+def _check(checks: list, name: str, func: Callable, *args) -> bool:
+    '''Run a validation check and add its result to checks. Returns True if it passed or was skipped'''
+    try:
+        func(*args)
+        checks.append({'name': name, 'status': 'Passed', 'message': None})
+        return True
+    except _Skipped as e:
+        checks.append({'name': name, 'status': 'Skipped', 'message': str(e)})
+        return True
+    except Exception as e:  # pylint: disable=broad-except
+        message = getattr(e, 'stderr', None) or str(e)
+        checks.append({'name': name, 'status': 'Failed', 'message': message.strip()})
+        return False
+
+
+def _validate_file_exists(path: Path):
+    if not path.is_file():
+        raise ValidationError(f'Template file not found: {path}')
+
+
+def _validate_arm_template(template_path: Path):
+    from azure.cli.command_modules.resource.custom import _remove_comments_from_json
+    with open(template_path, 'r', encoding='utf-8-sig') as f:
+        template = _remove_comments_from_json(f.read(), file_path=str(template_path))
+    if not isinstance(template, dict) or '$schema' not in template or 'resources' not in template:
+        raise ValidationError(f'{template_path} is not an ARM template (missing $schema or resources)')
+
+
+def _validate_bicep_template(template_path: Path):
+    from ._bicep import _get_bicep_executable, build_bicep_file
+    cli = _get_cli()
+    if not _get_bicep_executable(cli):
+        raise _Skipped('Bicep is not installed')
+    compiled_file, _ = build_bicep_file(cli, template_path)
+    if not compiled_file:  # caching is disabled
+        from azure.cli.command_modules.resource._bicep import run_bicep_command
+        run_bicep_command(cli, ['build', '--stdout', str(template_path)])
+
+
+def _validate_terraform_template(template_path: Path):
+    from ._terraform import check_terraform_install, terraform_validate
+    if not check_terraform_install(raise_error=False):
+        raise _Skipped('Terraform is not installed')
+    if (errors := terraform_validate(template_path.parent)):
+        raise ValidationError('\n'.join(errors))
+
+
+def validate_catalog_item(catalog_item: str) -> dict:
+    '''Validate a catalog item's manifest and template. Runs in a validation worker process.'''
+    start = time.perf_counter()
+    path = Path(catalog_item)
+    checks = []
+    manifest = None
+
+    def _load():
+        nonlocal manifest
+        manifest = get_manifest(path)
+
+    if _check(checks, 'manifest', _load) and _check(checks, 'runner', validate_manifest_runner, manifest):
+        template_path = Path(manifest.template_path)
+        if _check(checks, 'template', _validate_file_exists, template_path):
+            suffix = template_path.suffix.lower()
+            if suffix == '.json':
+                _check(checks, 'arm', _validate_arm_template, template_path)
+            elif suffix == '.bicep':
+                _check(checks, 'bicep', _validate_bicep_template, template_path)
+            elif suffix == '.tf':
+                _check(checks, 'terraform', _validate_terraform_template, template_path)
+
+    failed = [c for c in checks if c['status'] == 'Failed']
+    return {
+        'catalogItem': manifest.name if manifest else path.name,
+        'path': str(path),
+        'runner': getattr(manifest, 'runner', None),
+        'status': 'Failed' if failed else 'Passed',
+        'duration': round(time.perf_counter() - start, 2),
+        'checks': checks,
+        'errors': [f"{c['name']}: {c['message']}" for c in failed]
+    }
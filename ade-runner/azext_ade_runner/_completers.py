@@ -10,7 +10,6 @@ from azure.cli.core.commands.parameters import get_resources_in_resource_group,
 from azure.cli.core.decorators import Completer
 
 # from ._client_factory import cf_network, cf_resources
-from ._github import get_github_releases
 from ._logging import get_logger
 
 log = get_logger(__name__)
@@ -27,6 +26,7 @@ log = get_logger(__name__)
 
 @Completer
 def get_version_completion_list(cmd, prefix, ns, **kwargs):
+    from ._github import get_github_releases
     return [r['tag_name'] for r in get_github_releases()]
 
 
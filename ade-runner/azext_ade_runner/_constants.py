@@ -68,10 +68,6 @@ ADE_CATALOG_ITEM_NAME = 'ADE_CATALOG_ITEM_NAME'
 # For example: /mnt/catalog/root/Catalog/FunctionApp/azuredeploy.json
 ADE_CATALOG_ITEM_TEMPLATE = 'ADE_CATALOG_ITEM_TEMPLATE'
 
-_temp = os.environ.get(ADE_ACTION_TEMP)
-_storage = os.environ.get(ADE_ACTION_STORAGE)
-_output = os.environ.get(ADE_ACTION_OUTPUT)
-
 ACTION_ID = os.environ.get(ADE_ACTION_ID)
 ACTION_NAME = os.environ.get(ADE_ACTION_NAME)
 CATALOG = os.environ.get(ADE_CATALOG)
@@ -79,17 +75,26 @@ CATALOG_ITEM = os.environ.get(ADE_CATALOG_ITEM)
 
 ENVIRONMENT_RESOURCE_GROUP_NAME = os.environ.get(ADE_ENVIRONMENT_RESOURCE_GROUP_NAME)
 
-TEMP_DIR = Path(_temp).resolve() if IN_RUNNER \
-    else Path(__file__).resolve().parent.parent.parent / '.local' / 'temp'
-
-STORAGE_DIR = Path(_storage).resolve() if IN_RUNNER \
-    else Path(__file__).resolve().parent.parent.parent / '.local' / 'storage'
-
-OUTPUT_DIR = Path(_output).resolve() if IN_RUNNER \
-    else Path(__file__).resolve().parent.parent.parent / '.local' / 'storage' / '.output' / 'action'
+# directories are resolved on first use (see __getattr__ below) so importing
+# this module does not touch the file system when the command table loads
+_DIRS = {
+    # name: (environment variable used in the runner, path relative to .local used outside the runner)
+    'TEMP_DIR': (ADE_ACTION_TEMP, 'temp'),
+    'STORAGE_DIR': (ADE_ACTION_STORAGE, 'storage'),
+    'OUTPUT_DIR': (ADE_ACTION_OUTPUT, 'storage/.output/action'),
+    'CATALOG_ITEM_DIR': (ADE_CATALOG_ITEM, 'Environments/Echo'),
+}
+
+
+def __getattr__(name: str):
+    if name in _DIRS:
+        env_var, local_path = _DIRS[name]
+        value = Path(os.environ.get(env_var)).resolve() if IN_RUNNER \
+            else Path(__file__).resolve().parent.parent.parent / '.local' / local_path
+        globals()[name] = value
+        return value
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
 
-CATALOG_ITEM_DIR = Path(CATALOG_ITEM).resolve() if IN_RUNNER \
-    else Path(__file__).resolve().parent.parent.parent / '.local' / 'Environments' / 'Echo'
 
 # if IN_RUNNER:
 #     STORAGE_DIR.mkdir(parents=True, exist_ok=True)
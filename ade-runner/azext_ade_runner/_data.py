@@ -4,11 +4,12 @@
 # ------------------------------------
 # pylint: disable=too-many-instance-attributes
 
+import hashlib
+
 from dataclasses import MISSING, asdict, dataclass, field, fields, is_dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Literal, Optional, Union
-
-import yaml
+from typing import Callable, List, Literal, Optional, Union, get_args, get_origin
 
 from azure.cli.core.azclierror import ValidationError
 from azure.cli.core.util import is_guid
@@ -24,28 +25,153 @@ def _camel_to_snake(name: str):
     return ''.join(['_' + c.lower() if c.isupper() else c for c in name]).lstrip('_')
 
 
-def _validate_data_object(data_type: type, obj: dict, path: Path = None, parent_key: str = None):
-    '''Validates a dict data object against a dataclass type.
-    Ensures all required fields are present and that no invalid fields are present.'''
+class _Schema:
+    '''A validator and loader for a dataclass, compiled once per dataclass by compile_schema'''
+    __slots__ = ('data_type', 'fields', 'required', 'allowed', 'converters', 'defaults')
+
+    def __init__(self, data_type: type):
+        flds = fields(data_type)
+        self.data_type = data_type
+        # camelCase property name -> snake_case field name
+        self.fields = {_snake_to_camel(f.name): f.name for f in flds}
+        self.required = tuple(_snake_to_camel(f.name) for f in flds
+                              if f.default is MISSING and f.default_factory is MISSING)
+        self.allowed = frozenset(self.fields) | {'file', 'dir'}
+        self.converters = {_snake_to_camel(f.name): c for f in flds if (c := _compile_type(f.type))}
+        self.defaults = {f.name: f.default for f in flds if f.default is not MISSING}
+
+    def validate(self, obj: dict, path: Path = None, parent_key: str = None):
+        '''Ensures all required fields are present, that no invalid fields are present, and that values
+        have the field's type. Numbers are converted to strings for str fields (e.g. version: 1.0)'''
+        key_prefix = f'{parent_key}.' if parent_key else ''
+        name = f'{path}' if path else f'{self.data_type.__name__} object'
+
+        if not isinstance(obj, dict):
+            raise ValidationError(f'{name} must be an object')
+
+        for k in self.required:
+            if k not in obj:
+                raise ValidationError(f'{name} is missing required property: {key_prefix}{k}')
+            if not obj[k]:
+                raise ValidationError(f'{name} is missing a value for required property: {key_prefix}{k}')
+
+        if (invalid := obj.keys() - self.allowed):
+            k = next(k for k in obj if k in invalid)  # report the first in file order
+            raise ValidationError(f'{name} contains an invalid property: {key_prefix}{k}')
 
-    flds = fields(data_type)
-    all_fields = [_snake_to_camel(f.name) for f in flds]
-    req_fields = [_snake_to_camel(f.name) for f in flds if f.default is MISSING]
-    # opt_fields = [f.name for f in flds if f.default is not MISSING]
+        for k, v in obj.items():
+            if v is not None and (convert := self.converters.get(k)):
+                try:
+                    obj[k] = convert(v)
+                except TypeError as e:
+                    raise ValidationError(f'{name} property {key_prefix}{k} must be {e}, '
+                                          f'not {type(v).__name__}: {v}') from e
+
+    def load(self, instance, obj: dict):
+        '''Set the fields of an instance from a validated object, defaults first'''
+        for k, v in self.defaults.items():
+            setattr(instance, k, v)
+        for k, v in obj.items():
+            setattr(instance, self.fields.get(k) or _camel_to_snake(k), v)
 
-    key_prefix = f'{parent_key}.' if parent_key else ''
 
-    name = f'{path}' if path else f'{data_type.__name__} object'
+def _convert_str(v):
+    if isinstance(v, str):
+        return v
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        return str(v)
+    raise TypeError('a string')
 
-    for k in req_fields:
-        if k not in obj:
-            raise ValidationError(f'{name} is missing required property: {key_prefix}{k}')
-        if not obj[k]:
-            raise ValidationError(f'{name} is missing a value for required property: {key_prefix}{k}')
-        # TODO: Validate types
-    for k in obj:
-        if k not in all_fields and k not in ['file', 'dir']:
-            raise ValidationError(f'{name} contains an invalid property: {key_prefix}{k}')
+
+def _convert_path(v):
+    if isinstance(v, (str, Path)):
+        return v
+    raise TypeError('a path')
+
+
+def _convert_int(v):
+    if isinstance(v, int) and not isinstance(v, bool):
+        return v
+    raise TypeError('an integer')
+
+
+def _convert_bool(v):
+    if isinstance(v, bool):
+        return v
+    raise TypeError('true or false')
+
+
+def _compile_type(tp) -> Optional[Callable]:
+    '''Compile a field type to a function that returns the value (converted if needed) or raises TypeError
+    with a description of the type. Returns None for types that aren't checked'''
+    origin, args = get_origin(tp), get_args(tp)
+
+    if origin is Literal:
+        # literals are matched case insensitively, e.g. runner: terraform
+        values = {str(a).lower(): a for a in args}
+        description = 'one of ' + ', '.join(str(a) for a in args)
+
+        def _convert_literal(v):
+            if isinstance(v, str) and v.lower() in values:
+                return v
+            raise TypeError(description)
+        return _convert_literal
+
+    if origin is Union:
+        converters = [c for a in args if a is not type(None) and (c := _compile_type(a))]
+        if len(converters) < len([a for a in args if a is not type(None)]):
+            return None  # one of the types isn't checked
+        if len(converters) == 1:
+            return converters[0]
+
+        def _convert_union(v):
+            errors = []
+            for convert in converters:
+                try:
+                    return convert(v)
+                except TypeError as e:
+                    errors.append(str(e))
+            raise TypeError(' or '.join(errors))
+        return _convert_union
+
+    if origin in (list, List):
+        def _convert_list(v):
+            if isinstance(v, list):
+                return v
+            raise TypeError('a list')
+        return _convert_list
+
+    return {str: _convert_str, Path: _convert_path, int: _convert_int, bool: _convert_bool}.get(tp)
+
+
+@lru_cache(maxsize=None)
+def compile_schema(data_type: type) -> _Schema:
+    '''Get the compiled schema for a dataclass'''
+    return _Schema(data_type)
+
+
+@lru_cache(maxsize=None)
+def get_schema_hash(data_type: type) -> str:
+    '''Get a hash of a dataclass's fields, types and defaults, which changes when its schema does'''
+    h = hashlib.sha256()
+    for f in fields(data_type):
+        h.update(f'{f.name}:{f.type}:{f.default!r}\0'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def _validate_data_object(data_type: type, obj: dict, path: Path = None, parent_key: str = None):
+    '''Validates a dict data object against a dataclass type.
+    Ensures all required fields are present, that no invalid fields are present, and that values have the right type.'''
+    compile_schema(data_type).validate(obj, path=path, parent_key=parent_key)
+
+
+def slotted(cls):
+    '''Recreate a dataclass with __slots__ for compact instances (dataclass(slots=True) needs python 3.10).
+    Instances must set every field in __init__, compile_schema(cls).load sets the defaults.'''
+    names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in names and k not in ('__dict__', '__weakref__')}
+    namespace['__slots__'] = names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)
 
 
 def get_dict(instance):
@@ -65,6 +191,7 @@ def has_only(instance, field_name: str) -> bool:
         raise Exception(f'has_only() can only be used with dataclass or dict instances')
 
 
+@slotted
 @dataclass
 class Manifest:
     file: Path
@@ -73,19 +200,23 @@ class Manifest:
     version: str
     summary: str
     description: str
-    runner: Literal['ARM', 'Terraform']  # str
+    runner: Literal['ARM', 'Bicep', 'Terraform', 'TF']
     template_path: Union[str, Path]  # Path
 
     dir: Path = None
+    parallelism: Optional[int] = None  # terraform -parallelism, chosen by the runner if not set
 
-    def __init__(self, obj: dict, path: Path) -> None:
+    def __init__(self, obj: dict, path: Path, validate: bool = True) -> None:
+        if not isinstance(obj, dict):
+            raise ValidationError(f'{path} must be an object')
         if 'file' not in obj:
             obj['file'] = path
 
-        _validate_data_object(Manifest, obj, path=path)
+        schema = compile_schema(Manifest)
+        if validate:
+            schema.validate(obj, path=path)
 
-        for k, v in obj.items():
-            setattr(self, _camel_to_snake(k), v)
+        schema.load(self, obj)
 
         self.dir = path.parent
         self.template_path = path.parent / self.template_path
@@ -4,13 +4,26 @@
 # ------------------------------------
 # pylint: disable=logging-fstring-interpolation, too-many-statements, too-many-locals, too-many-lines
 
+import os
+import random
+import threading
+import time
+
+from pathlib import Path
+
 import requests
 
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
 from azure.cli.core.azclierror import ClientRequestError, MutuallyExclusiveArgumentError, ResourceNotFoundError
 from azure.cli.core.util import should_disable_connection_verify
 
-from ._constants import EXT_REPO_NAME, EXT_REPO_OWNER
+from ._cache import cache_key, read_cache, write_cache
+from ._constants import EXT_NAME, EXT_REPO_NAME, EXT_REPO_OWNER
 from ._logging import get_logger
+from ._metrics import RETRIES, inc
+from ._tracing import span
 
 ERR_TMPL_PRDR_TEMPLATES = 'Unable to get templates.\n'
 ERR_TMPL_NON_200 = f'{ERR_TMPL_PRDR_TEMPLATES}Server returned status code {{}} for {{}}'
@@ -19,14 +32,161 @@ ERR_TMPL_BAD_JSON = f'{ERR_TMPL_PRDR_TEMPLATES}Response body does not contain va
 
 TRIES = 3
 
+# The number of times failed requests are retried, and the base backoff (seconds) between retries.
+# Retries back off exponentially with jitter and honor Retry-After headers, both capped to MAX_BACKOFF.
+ADE_RUNNER_HTTP_RETRIES = 'ADE_RUNNER_HTTP_RETRIES'
+ADE_RUNNER_HTTP_BACKOFF = 'ADE_RUNNER_HTTP_BACKOFF'
+DEFAULT_BACKOFF = 0.5
+MAX_BACKOFF = 30
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+REQUEST_TIMEOUT = (10, 60)  # connect, read
+
+RELEASE_CACHE = 'github'
+RELEASE_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+# The number of seconds cached release metadata is used before it is revalidated with GitHub.
+ADE_RUNNER_GITHUB_CACHE_TTL = 'ADE_RUNNER_GITHUB_CACHE_TTL'
+DEFAULT_CACHE_TTL = 3600
+
 log = get_logger(__name__)
 
+_session = None
+_session_lock = threading.Lock()
+
+
+class _JitterRetry(Retry):
+    '''Retry policy with capped exponential backoff and jitter, and Retry-After capped to the same maximum'''
+
+    def get_backoff_time(self):
+        return _jitter(min(MAX_BACKOFF, super().get_backoff_time()))
+
+    def get_retry_after(self, response):
+        # secondary rate limits can ask for minutes, don't block the command that long
+        if (retry_after := super().get_retry_after(response)) is None:
+            return None
+        return min(MAX_BACKOFF, retry_after)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        retry = super().increment(method, url, response=response, error=error, _pool=_pool, _stacktrace=_stacktrace)
+        # only counted once the retry is allowed, increment raises when the retries are exhausted
+        reason = str(response.status) if response is not None else type(error).__name__
+        inc(RETRIES, operation='github.request', reason=reason)
+        return retry
+
+
+def _jitter(backoff: float) -> float:
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def _get_env_number(name: str, default, cast=float):
+    try:
+        return cast(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def _get_session() -> requests.Session:
+    '''Get the pooled session used for all GitHub requests so connections are reused across calls'''
+    global _session  # pylint: disable=global-statement
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = _JitterRetry(total=_get_env_number(ADE_RUNNER_HTTP_RETRIES, TRIES, int),
+                                     backoff_factor=_get_env_number(ADE_RUNNER_HTTP_BACKOFF, DEFAULT_BACKOFF),
+                                     status_forcelist=RETRY_STATUS_CODES,
+                                     respect_retry_after_header=True,
+                                     raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'User-Agent': f'az-{EXT_NAME}'})
+                _session = session
+    return _session
+
+
+def _get(url: str, headers: dict = None) -> requests.Response:
+    with span('github.request', url=url) as request_span:
+        response = _get_session().get(url, headers=headers, timeout=REQUEST_TIMEOUT,
+                                      verify=not should_disable_connection_verify())
+        request_span.set(status=response.status_code)
+        return response
+
+
+def _get_release_cache_root() -> Path:
+    # version checks and completion run on users' machines, so this lives in the az config dir
+    from azure.cli.core._environment import get_config_dir
+    return Path(get_config_dir()) / EXT_NAME / 'cache'
+
+
+def _get_cache_ttl() -> float:
+    try:
+        return float(os.environ.get(ADE_RUNNER_GITHUB_CACHE_TTL, DEFAULT_CACHE_TTL))
+    except ValueError:
+        return DEFAULT_CACHE_TTL
+
+
+def _get_github_json(url: str):
+    '''Get a GitHub API resource through the release metadata cache. Returns the status code and json body
+    (None for errors). Only successful responses are cached.
+    Entries younger than the TTL are returned without a request. Older entries are revalidated with
+    If-None-Match, so unchanged resources cost a 304 that does not count against the rate limit.'''
+    root = _get_release_cache_root()
+    key = cache_key(url)
+
+    entry = read_cache(RELEASE_CACHE, key, root=root)
+    if entry and time.time() - entry['fetched'] < _get_cache_ttl():
+        log.info(f'Using cached response for {url}')
+        return entry['status'], entry['body']
+
+    headers = {'Accept': 'application/vnd.github+json'}
+    if entry and entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+
+    try:
+        response = _get(url, headers=headers)
+    except requests.exceptions.RequestException:
+        if entry:
+            log.info(f'Request to {url} failed, using stale cached response')
+            return entry['status'], entry['body']
+        raise
+
+    if response.status_code == 304 and entry:
+        log.info(f'Cached response for {url} is still valid')
+        entry['fetched'] = time.time()
+        write_cache(RELEASE_CACHE, key, entry, root=root, max_bytes=RELEASE_CACHE_MAX_BYTES)
+        return entry['status'], entry['body']
+
+    if response.status_code in (403, 429) or response.status_code >= 500:
+        if entry:  # rate limited or unavailable, a stale response is better than none
+            log.info(f'Request to {url} returned {response.status_code}, using stale cached response')
+            return entry['status'], entry['body']
+        return response.status_code, None  # error bodies may not be json (e.g. an html error page)
+
+    if response.status_code >= 400:
+        # not cached, so a release published after a 404 (version check) is found on the next request
+        return response.status_code, None
+
+    body = response.json()
+
+    write_cache(RELEASE_CACHE, key, {
+        'url': url,
+        'status': response.status_code,
+        'etag': response.headers.get('ETag'),
+        'fetched': time.time(),
+        'body': body
+    }, root=root, max_bytes=RELEASE_CACHE_MAX_BYTES)
+
+    return response.status_code, body
+
 
 def get_github_releases(org=EXT_REPO_OWNER, repo=EXT_REPO_NAME, prerelease=False):
     url = f'https://api.github.com/repos/{org}/{repo}/releases'
 
-    version_res = requests.get(url, verify=not should_disable_connection_verify())
-    version_json = version_res.json()
+    status_code, version_json = _get_github_json(url)
+
+    if status_code >= 400:
+        raise ClientRequestError(ERR_TMPL_NON_200.format(status_code, url))
 
     return [v for v in version_json if v['prerelease'] == prerelease]
 
@@ -44,14 +204,17 @@ def get_github_release(org=EXT_REPO_OWNER, repo=EXT_REPO_NAME, version: str = No
 
     url += (f'/tags/{version}' if version else '/latest')
 
-    version_res = requests.get(url, verify=not should_disable_connection_verify())
+    status_code, version_json = _get_github_json(url)
 
-    if version_res.status_code == 404:
+    if status_code == 404:
         raise ClientRequestError(
             f'No release version exists for {org}/{repo}. Specify a specific prerelease version with --version '
             'or use latest prerelease with --pre')
 
-    return version_res.json()
+    if status_code >= 400:
+        raise ClientRequestError(ERR_TMPL_NON_200.format(status_code, url))
+
+    return version_json
 
 
 def get_github_latest_release_version(org=EXT_REPO_OWNER, repo=EXT_REPO_NAME, prerelease=False) -> str:
@@ -63,19 +226,20 @@ def get_github_latest_release_version(org=EXT_REPO_OWNER, repo=EXT_REPO_NAME, pr
 def github_release_version_exists(version: str, org=EXT_REPO_OWNER, repo=EXT_REPO_NAME):
     log.info(f'Checking if release version {version} exists on GitHub ({org}/{repo})')
     version_url = f'https://api.github.com/repos/{org}/{repo}/releases/tags/{version}'
-    version_res = requests.get(version_url, verify=not should_disable_connection_verify())
-    return version_res.status_code < 400
+    status_code, _ = _get_github_json(version_url)
+    return status_code < 400
 
 
 def get_release_asset(asset_url: str, to_json=True):  # pylint: disable=inconsistent-return-statements
     for try_number in range(TRIES):
         try:
-            response = requests.get(asset_url, verify=(not should_disable_connection_verify()))
+            response = _get(asset_url)
             if response.status_code == 200:
                 return response.json() if to_json else response
             msg = ERR_TMPL_NON_200.format(response.status_code, asset_url)
             raise ClientRequestError(msg)
-        except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError) as err:
+        except (requests.exceptions.ConnectionError, requests.exceptions.HTTPError,
+                requests.exceptions.RetryError, requests.exceptions.Timeout) as err:
             msg = ERR_TMPL_NO_NETWORK.format(str(err))
             raise ClientRequestError(msg) from err
         except ValueError as err:
@@ -83,8 +247,8 @@ def get_release_asset(asset_url: str, to_json=True):  # pylint: disable=inconsis
             if try_number == TRIES - 1:
                 msg = ERR_TMPL_BAD_JSON.format(str(err))
                 raise ClientRequestError(msg) from err
-            import time  # pylint: disable=import-outside-toplevel
-            time.sleep(0.5)
+            inc(RETRIES, operation='github.asset', reason='InvalidJson')
+            time.sleep(_jitter(min(MAX_BACKOFF, DEFAULT_BACKOFF * 2 ** try_number)))
             continue
 
 
@@ -13,6 +13,99 @@ type: group
 short-summary: {EXT_DESCRIPTION}.
 """
 
+# -----------------------
+# ade-runner run-batch
+# -----------------------
+
+helps[f'{EXT_NAME} run-batch'] = f"""
+type: command
+short-summary: Run an action for many catalog items concurrently.
+examples:
+  - name: Deploy every catalog item in a catalog to a single resource group.
+    text: az {EXT_NAME} run-batch --catalog ./Catalog --action deploy -g MyResourceGroup
+  - name: Deploy two catalog items, each to its own resource group.
+    text: az {EXT_NAME} run-batch --catalog ./Catalog -i FunctionApp WebApp --action deploy -g RgOne RgTwo
+  - name: Deploy catalog items matching a glob pattern to a single resource group, 8 at a time.
+    text: az {EXT_NAME} run-batch --catalog ./Catalog -i 'Function*' --action deploy -g MyResourceGroup --concurrency 8
+"""
+
+# -----------------------
+# ade-runner validate
+# -----------------------
+
+helps[f'{EXT_NAME} validate'] = f"""
+type: command
+short-summary: Validate the manifests and templates of catalog items without deploying them.
+long-summary: |
+    Each catalog item's manifest is loaded and its template is checked for its runner: ARM templates are parsed,
+    Bicep templates are compiled and Terraform configurations are initialized without a backend and validated.
+    Catalog items are validated in parallel worker processes and the command fails if any catalog item is invalid.
+examples:
+  - name: Validate every catalog item in a catalog.
+    text: az {EXT_NAME} validate --catalog ./Catalog
+  - name: Validate catalog items matching a glob pattern and write a JSON report.
+    text: az {EXT_NAME} validate --catalog ./Catalog -i 'Function*' --report ./validation.json
+"""
+
+# -----------------------
+# ade-runner cache
+# -----------------------
+
+helps[f'{EXT_NAME} cache'] = """
+type: group
+short-summary: Manage the runner's on-disk caches.
+"""
+
+helps[f'{EXT_NAME} cache stats'] = f"""
+type: command
+short-summary: Show the number of entries, size, hits and misses for the runner's caches.
+examples:
+  - name: Show stats for all caches.
+    text: az {EXT_NAME} cache stats
+  - name: Show stats for the manifest cache.
+    text: az {EXT_NAME} cache stats --name manifests
+"""
+
+helps[f'{EXT_NAME} cache warm'] = f"""
+type: command
+short-summary: Load the manifests and compile the Bicep templates of catalog items into the caches.
+long-summary: Subsequent runs of unchanged catalog items skip manifest parsing and Bicep compilation.
+examples:
+  - name: Warm the caches for every catalog item in a catalog.
+    text: az {EXT_NAME} cache warm --catalog ./Catalog
+"""
+
+helps[f'{EXT_NAME} cache purge'] = f"""
+type: command
+short-summary: Delete the runner's caches.
+examples:
+  - name: Delete all caches.
+    text: az {EXT_NAME} cache purge --yes
+"""
+
+# -----------------------
+# ade-runner metrics
+# -----------------------
+
+helps[f'{EXT_NAME} metrics'] = """
+type: group
+short-summary: Work with the Prometheus metrics files written by the runner.
+"""
+
+helps[f'{EXT_NAME} metrics merge'] = f"""
+type: command
+short-summary: Merge the metrics files of many actions into one.
+long-summary: |
+    Each action writes metrics.prom (Prometheus text format) to its output directory with phase duration
+    histograms, retry and deployment outcome counters, and terraform plan change counts.
+    Samples with the same name and labels are summed, so the merged file covers every action.
+examples:
+  - name: Merge the metrics files of every action in a directory and write them for the node exporter.
+    text: az {EXT_NAME} metrics merge --files ./actions --outfile /var/lib/node_exporter/ade-runner.prom
+  - name: Print the merged metrics of two actions.
+    text: az {EXT_NAME} metrics merge --files ./deploy/metrics.prom ./delete/metrics.prom
+"""
+
 # -----------------------
 # ade-runner version
 # ade-runner upgrade
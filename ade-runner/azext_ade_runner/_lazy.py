@@ -0,0 +1,27 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+# The command table and arguments are loaded for every az invocation (including
+# tab completion), so validators and transformers are referenced by name here and
+# their modules (and dependencies like requests and yaml) are only imported when
+# a command actually runs.
+
+from importlib import import_module
+
+
+def lazy_validator(name: str, module: str = '_validators'):
+    '''Get a validator that imports the validator function from the module when it is called'''
+    def validator(cmd, ns):
+        return getattr(import_module(f'.{module}', __package__), name)(cmd, ns)
+    validator.__name__ = name
+    return validator
+
+
+def lazy_transformer(name: str, module: str = '_transformers'):
+    '''Get a table transformer that imports the transformer function from the module when it is called'''
+    def transformer(result):
+        return getattr(import_module(f'.{module}', __package__), name)(result)
+    transformer.__name__ = name
+    return transformer
@@ -4,11 +4,103 @@
 # ------------------------------------
 # pylint: disable=logging-fstring-interpolation
 
+import atexit
+import logging
 import os
+import queue
+import threading
+import time
+
+from logging.handlers import QueueHandler
 
 from knack.log import get_logger as knack_get_logger
 
-from ._constants import ACTION_NAME, IN_RUNNER, STORAGE_DIR
+from ._constants import ACTION_NAME, ADE_ACTION_PARAMETERS, IN_RUNNER
+
+LOG_FILE_NAME = 'runner.log'
+
+# The number of seconds the log writer waits to batch records before writing them to the log file.
+ADE_RUNNER_LOG_FLUSH_INTERVAL = 'ADE_RUNNER_LOG_FLUSH_INTERVAL'
+DEFAULT_FLUSH_INTERVAL = 1.0
+MAX_BATCH_SIZE = 1000
+
+_STOP = object()
+
+_lock = threading.Lock()
+_handler = None  # the single queue handler shared by every logger in the process
+_writer = None
+
+
+class _LogWriter(threading.Thread):
+    '''Background thread that writes queued log records to the log file in batches'''
+
+    def __init__(self, log_file, records: queue.SimpleQueue, flush_interval: float):
+        super().__init__(name='ade-runner-log-writer', daemon=True)
+        self.log_file = log_file
+        self.records = records
+        self.flush_interval = flush_interval
+        self.formatter = logging.Formatter('{asctime} [{name:^28}] {levelname:<8}: {message}',
+                                           datefmt='%m/%d/%Y %I:%M:%S %p', style='{',)
+
+    def run(self):
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            while True:
+                batch = [self.records.get()]  # block until there is something to write
+                deadline = time.monotonic() + self.flush_interval
+                while batch[-1] is not _STOP and len(batch) < MAX_BATCH_SIZE:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self.records.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+
+                lines = [self.formatter.format(r) for r in batch if r is not _STOP]
+                if lines:
+                    f.write('\n'.join(lines) + '\n')
+                    f.flush()
+
+                if batch[-1] is _STOP:
+                    return
+
+    def stop(self, timeout: float = 5.0):
+        self.records.put(_STOP)
+        self.join(timeout)
+
+
+def _get_flush_interval() -> float:
+    try:
+        return max(0.0, float(os.environ.get(ADE_RUNNER_LOG_FLUSH_INTERVAL, DEFAULT_FLUSH_INTERVAL)))
+    except ValueError:
+        return DEFAULT_FLUSH_INTERVAL
+
+
+def _get_handler():
+    '''Get the queue handler shared by all loggers, creating it and starting the writer on first use'''
+    global _handler, _writer  # pylint: disable=global-statement
+
+    if _handler is not None:
+        return _handler or None
+
+    with _lock:
+        if _handler is not None:
+            return _handler or None
+
+        from ._constants import STORAGE_DIR
+        if not STORAGE_DIR.is_dir():
+            _handler = False
+            return None
+
+        records = queue.SimpleQueue()
+        _writer = _LogWriter(STORAGE_DIR / LOG_FILE_NAME, records, _get_flush_interval())
+        _writer.start()
+        atexit.register(_writer.stop)
+
+        _handler = QueueHandler(records)
+
+    _log_runner_info()
+    return _handler
 
 
 def get_logger(name: str):
@@ -17,32 +109,27 @@ def get_logger(name: str):
 
     # this must only happen in the builder, otherwise
     # the log file could be created on users machines
-    if IN_RUNNER and STORAGE_DIR.is_dir():
-        import logging
-        log_file = STORAGE_DIR / 'runner.log'
-        formatter = logging.Formatter('{asctime} [{name:^28}] {levelname:<8}: {message}',
-                                      datefmt='%m/%d/%Y %I:%M:%S %p', style='{',)
-        fh = logging.FileHandler(log_file)
-        fh.setLevel(level=_logger.level)
-        fh.setFormatter(formatter)
-        _logger.addHandler(fh)
+    if IN_RUNNER and (handler := _get_handler()) and handler not in _logger.handlers:
+        _logger.addHandler(handler)
 
     return _logger
 
 
-log = get_logger(__name__)
-
-log.info('##################################')
-log.info('Azure Depoyment Environment Runner')
-log.info('##################################')
-log.info('')
-log.info(f'IN_RUNNER: {IN_RUNNER}')
-log.info('')
-log.info(f'Running action: {ACTION_NAME}')
-log.info('')
-log.info('ENVIRONMENT VARIABLES:')
-log.info('======================')
-for key, value in os.environ.items():
-    log.info(f'{key}: {value}')
-log.info('======================')
-log.info('')
+def _log_runner_info():
+    _log = get_logger(__name__)
+    _log.info('##################################')
+    _log.info('Azure Depoyment Environment Runner')
+    _log.info('##################################')
+    _log.info('')
+    _log.info(f'IN_RUNNER: {IN_RUNNER}')
+    _log.info('')
+    _log.info(f'Running action: {ACTION_NAME}')
+    _log.info('')
+    _log.info('ENVIRONMENT VARIABLES:')
+    _log.info('======================')
+    # only the runner's variables, the parameters may contain secure values
+    for key, value in sorted(os.environ.items()):
+        if key.startswith('ADE_') and key != ADE_ACTION_PARAMETERS:
+            _log.info(f'{key}: {value}')
+    _log.info('======================')
+    _log.info('')
@@ -0,0 +1,250 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import atexit
+import math
+import os
+import re
+import threading
+
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from ._constants import IN_RUNNER
+from ._logging import get_logger
+from ._utils import update_file
+
+# metrics are written to this file in the output directory in the prometheus text format
+# (for the node exporter textfile collector), use az ade-runner metrics merge to combine the files of many actions
+METRICS_FILE_NAME = 'metrics.prom'
+
+# set to 1 to collect metrics outside the runner, or 0 to stop collecting them in the runner
+ADE_RUNNER_METRICS = 'ADE_RUNNER_METRICS'
+METRICS_ENABLED = os.environ.get(ADE_RUNNER_METRICS, '1' if IN_RUNNER else '0').lower() not in ('0', 'false', '')
+
+PHASE_DURATION = 'ade_runner_phase_duration_seconds'
+RETRIES = 'ade_runner_retries_total'
+DEPLOYMENTS = 'ade_runner_deployments_total'
+TERRAFORM_PLAN_CHANGES = 'ade_runner_terraform_plan_changes_total'
+
+# name: (type, help)
+METRICS = {
+    PHASE_DURATION: ('histogram', 'Duration of the runner phases (validation, compilation, deployment, terraform '
+                     'commands) in seconds'),
+    RETRIES: ('counter', 'Retried deployments and requests'),
+    DEPLOYMENTS: ('counter', 'Deployments by runner and outcome (succeeded, failed or skipped)'),
+    TERRAFORM_PLAN_CHANGES: ('counter', 'Resource changes in terraform plans by change action'),
+}
+
+# seconds, from validators and cached compilation to long running deployments
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+_HISTOGRAM_SUFFIXES = ('_bucket', '_sum', '_count')
+_SAMPLE_PATTERN = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)(?:\s+-?\d+)?\s*$')
+_LABEL_PATTERN = re.compile(r'\s*([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"\s*,?')
+
+log = get_logger(__name__)
+
+_lock = threading.Lock()
+_samples = {}  # (sample name, labels): value
+_registered = False
+
+
+class Metrics:
+    '''Metric families (name: (type, help)) and their samples ((sample name, labels): value),
+    the labels of a sample are a sorted tuple of (name, value) pairs'''
+    __slots__ = ('families', 'samples')
+
+    def __init__(self, families: Dict[str, Tuple[str, str]] = None, samples: Dict[tuple, float] = None):
+        self.families = dict(families or {})
+        self.samples = dict(samples or {})
+
+    def merge(self, other: 'Metrics'):
+        '''Add the samples of other to these samples. Counters and histogram buckets, sums and counts are summed'''
+        for name, family in other.families.items():
+            self.families.setdefault(name, family)
+        for key, value in other.samples.items():
+            self.samples[key] = self.samples.get(key, 0) + value
+        return self
+
+    def get_family(self, sample_name: str) -> str:
+        for suffix in _HISTOGRAM_SUFFIXES:
+            if sample_name.endswith(suffix) and (name := sample_name[:-len(suffix)]) in self.families:
+                return name
+        return sample_name
+
+    def to_text(self) -> str:
+        '''Format the metrics in the prometheus text format'''
+        families = {}
+        for key in self.samples:
+            families.setdefault(self.get_family(key[0]), []).append(key)
+
+        lines = []
+        for name in sorted(families):
+            metric_type, help_text = self.families.get(name, ('untyped', None))
+            if help_text:
+                lines.append(f'# HELP {name} {_escape_help(help_text)}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample_name, labels in sorted(families[name], key=_sort_key):
+                value = self.samples[(sample_name, labels)]
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _sort_key(key: tuple):
+    '''Sort histogram samples by their labels (without le), then the buckets by le, then the sum and count'''
+    sample_name, labels = key
+    suffix = next((i for i, s in enumerate(_HISTOGRAM_SUFFIXES) if sample_name.endswith(s)), -1)
+    le = next((_parse_value(v) for k, v in labels if k == 'le'), 0)
+    return tuple((k, v) for k, v in labels if k != 'le'), suffix, le, sample_name
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _unescape_label(value: str) -> str:
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(round(value, 6))
+
+
+def _format_le(bound: float) -> str:
+    return '+Inf' if math.isinf(bound) else _format_value(bound)
+
+
+def _parse_value(value: str) -> float:
+    return float(value.replace('Inf', 'inf'))
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def parse_metrics(text: str, path: Path = None) -> Metrics:
+    '''Parse metrics in the prometheus text format. Raises ValueError if a line is invalid'''
+    metrics = Metrics()
+    helps = {}
+    for number, line in enumerate(text.splitlines(), 1):
+        if not (line := line.strip()):
+            continue
+        if line.startswith('#'):
+            parts = line.split(None, 3)
+            if len(parts) >= 3 and parts[1] == 'TYPE':
+                metrics.families[parts[2]] = (parts[3] if len(parts) > 3 else 'untyped', helps.get(parts[2]))
+            elif len(parts) >= 3 and parts[1] == 'HELP':
+                helps[parts[2]] = parts[3].replace('\\n', '\n').replace('\\\\', '\\') if len(parts) > 3 else ''
+                if parts[2] in metrics.families:
+                    metrics.families[parts[2]] = (metrics.families[parts[2]][0], helps[parts[2]])
+            continue
+        if not (m := _SAMPLE_PATTERN.match(line)):
+            raise ValueError(f'Invalid metrics line {number}' + (f' in {path}' if path else '') + f': {line}')
+        name, labels_text, value = m.groups()
+        labels = {}
+        if labels_text and (labels_text := labels_text.strip()):
+            pos = 0
+            while pos < len(labels_text):
+                if not (label := _LABEL_PATTERN.match(labels_text, pos)):
+                    raise ValueError(f'Invalid labels on metrics line {number}' + (f' in {path}' if path else '')
+                                     + f': {line}')
+                labels[label.group(1)] = _unescape_label(label.group(2))
+                pos = label.end()
+        key = (name, _labels(labels))
+        metrics.samples[key] = metrics.samples.get(key, 0) + _parse_value(value)
+    return metrics
+
+
+def read_metrics(path: Path) -> Metrics:
+    '''Read a metrics file in the prometheus text format'''
+    with open(path, 'r', encoding='utf-8') as f:
+        return parse_metrics(f.read(), path)
+
+
+def merge_metrics(paths: Iterable[Path]) -> Metrics:
+    '''Merge the metrics files of many actions into one'''
+    merged = Metrics()
+    for path in paths:
+        merged.merge(read_metrics(path))
+    return merged
+
+
+def _register():
+    global _registered  # pylint: disable=global-statement
+    if not _registered:
+        _registered = True
+        atexit.register(write_metrics)
+
+
+def inc(name: str, value: float = 1, **labels):
+    '''Increment a counter'''
+    if not METRICS_ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _samples[key] = _samples.get(key, 0) + value
+        _register()
+
+
+def observe(name: str, value: float, buckets: tuple = DURATION_BUCKETS, **labels):
+    '''Add an observation to a histogram'''
+    if not METRICS_ENABLED:
+        return
+    labels = _labels(labels)
+    with _lock:
+        # buckets are cumulative, empty buckets are kept so every file has the same buckets
+        for bound in buckets + (math.inf,):
+            key = (f'{name}_bucket', tuple(sorted(labels + (('le', _format_le(bound)),))))
+            _samples[key] = _samples.get(key, 0) + (1 if value <= bound else 0)
+        _samples[(f'{name}_sum', labels)] = _samples.get((f'{name}_sum', labels), 0) + value
+        _samples[(f'{name}_count', labels)] = _samples.get((f'{name}_count', labels), 0) + 1
+        _register()
+
+
+def write_metrics(path: Path = None):
+    '''Add this process's metrics to the metrics file in the output directory. Metrics from earlier
+    az invocations (and worker processes) of the same action are summed, so the file covers the action'''
+    with _lock:
+        samples = dict(_samples)
+        _samples.clear()
+    if not samples:
+        return None
+
+    if path is None:
+        from ._constants import OUTPUT_DIR
+        path = OUTPUT_DIR / METRICS_FILE_NAME
+
+    metrics = Metrics(METRICS, samples)
+
+    def _merge(content):
+        try:
+            return parse_metrics(content, path).merge(metrics).to_text() if content else metrics.to_text()
+        except ValueError as e:
+            log.warning(f'Replacing invalid metrics file {path}: {e}')
+            return metrics.to_text()
+
+    try:
+        update_file(path, _merge)
+        log.info(f'Wrote metrics to {path}')
+    except OSError as e:
+        log.warning(f'Unable to write metrics to {path}: {e}')
+        return None
+    return path
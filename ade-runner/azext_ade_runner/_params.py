@@ -10,8 +10,7 @@ from azure.cli.core.commands.parameters import (file_type, get_enum_type, get_lo
 
 from ._completers import get_version_completion_list
 from ._constants import EXT_NAME
-from ._validators import (catalog_item_validator, catalog_validator, environment_resource_group_validator,
-                          out_validator, source_version_validator)
+from ._lazy import lazy_validator
 
 # from knack.arguments import CLIArgumentType
 
@@ -28,7 +27,7 @@ def load_arguments(self, _):
 
     with self.argument_context(f'{EXT_NAME} upgrade') as c:
         c.argument('version', options_list=['--version', '-v'], help='Version (tag). Default: latest stable.',
-                   validator=source_version_validator, completer=get_version_completion_list)
+                   validator=lazy_validator('source_version_validator'), completer=get_version_completion_list)
         c.argument('prerelease', options_list=['--pre'], action='store_true',
                    help='Update to the latest prerelease version.')
 
@@ -47,3 +46,58 @@ def load_arguments(self, _):
         c.argument('environment_resource_group_name', options_list=['--resource-group', '-g'],
                    help='The environment resource group name.')
         c.ignore('manifest')
+
+    with self.argument_context(f'{EXT_NAME} run-batch') as c:
+        # this command uses a command level validator, arg level validators are ignored
+        c.argument('catalog', options_list=['--catalog', '-c'],
+                   help='Path to the Catalog.')
+        c.argument('catalog_items', options_list=['--catalog-items', '-i'], nargs='*',
+                   help='Space-separated catalog item names, paths, or glob patterns relative to the Catalog. '
+                   'Default: all catalog items in the Catalog.')
+        c.argument('action_name', options_list=['--action', '-a'], help='The action name.')
+        c.argument('action_parameters', options_list=['--parameters', '-p'],
+                   help='The action parameters used for every catalog item.')
+        c.argument('resource_groups', options_list=['--resource-groups', '-g'], nargs='+',
+                   help='Space-separated environment resource group names. Provide a single resource group '
+                   'for all catalog items, or one resource group for each catalog item.')
+        c.argument('concurrency', type=int, help='The maximum number of catalog items to run concurrently.')
+        c.ignore('manifests')
+
+    with self.argument_context(f'{EXT_NAME} validate') as c:
+        # this command uses a command level validator, arg level validators are ignored
+        c.argument('catalog', options_list=['--catalog', '-c'], help='Path to the Catalog.')
+        c.argument('catalog_items', options_list=['--catalog-items', '-i'], nargs='*',
+                   help='Space-separated catalog item names, paths, or glob patterns relative to the Catalog. '
+                   'Default: all catalog items in the Catalog.')
+        c.argument('concurrency', type=int,
+                   help='The number of worker processes that validate catalog items. Default: the number of CPUs.')
+        c.argument('report', help='Path to write a JSON report of the validation results to.')
+
+    for scope in ['run', 'run-batch']:
+        with self.argument_context(f'{EXT_NAME} {scope}') as c:
+            c.argument('skip_unchanged', action='store_true',
+                       help='Skip the deployment and use the saved outputs when the template, parameters and '
+                       'resource group are unchanged since the last successful deployment.')
+            c.argument('verify_resource_group', options_list=['--verify-resource-group', '--verify-rg'],
+                       action='store_true',
+                       help='With --skip-unchanged, only skip the deployment if the resource group still exists.')
+
+    with self.argument_context(f'{EXT_NAME} cache') as c:
+        c.argument('name', options_list=['--name', '-n'], help='Cache name, e.g. manifests. Default: all caches.')
+
+    with self.argument_context(f'{EXT_NAME} cache warm') as c:
+        # this command uses a command level validator, arg level validators are ignored
+        c.argument('catalog', options_list=['--catalog', '-c'], help='Path to the Catalog.')
+        c.argument('catalog_items', options_list=['--catalog-items', '-i'], nargs='*',
+                   help='Space-separated catalog item names, paths, or glob patterns relative to the Catalog. '
+                   'Default: all catalog items in the Catalog.')
+        c.argument('concurrency', type=int, help='The maximum number of templates to compile concurrently.')
+        c.ignore('manifests')
+
+    with self.argument_context(f'{EXT_NAME} metrics merge') as c:
+        # this command uses a command level validator, arg level validators are ignored
+        c.argument('files', options_list=['--files', '-f'], nargs='+',
+                   help='Space-separated metrics files, directories to search for metrics.prom files, '
+                   'or glob patterns.')
+        c.argument('outfile', options_list=['--outfile'],
+                   help='Path to write the merged metrics file to. Default: print the merged metrics.')
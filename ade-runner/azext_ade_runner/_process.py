@@ -0,0 +1,199 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import codecs
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from collections import deque
+from pathlib import Path
+from typing import Callable, Iterator, List, Optional
+
+from ._logging import get_logger
+
+# output lines longer than this are split, so a process can't make a pump hold an unbounded line in memory
+MAX_LINE_BYTES = 64 * 1024
+# the size of the chunks iter_process_output reads from stdout
+CHUNK_SIZE = 1024 * 1024
+# the number of lines of each stream kept for error messages
+TAIL_LINES = 200
+# seconds to wait after SIGTERM before killing the process
+KILL_GRACE = 30
+POLL_INTERVAL = 0.1
+
+log = get_logger(__name__)
+
+
+class ProcessResult:  # pylint: disable=too-few-public-methods
+    '''The exit code, output tail and resource usage of a process'''
+
+    def __init__(self, args: List[str], returncode: int, stdout: deque, stderr: deque, wall: float,
+                 user: float = None, system: float = None, max_rss: int = None, timed_out: bool = False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = list(stdout)
+        self.stderr = list(stderr)
+        self.wall = wall
+        self.user = user
+        self.system = system
+        self.max_rss = max_rss
+        self.timed_out = timed_out
+
+    def to_dict(self) -> dict:
+        return {
+            'args': self.args,
+            'exitCode': self.returncode,
+            'wall': round(self.wall, 3),
+            'user': None if self.user is None else round(self.user, 3),
+            'sys': None if self.system is None else round(self.system, 3),
+            'maxRss': self.max_rss,
+            'timedOut': self.timed_out
+        }
+
+
+def _pump(pipe, sink, tail: deque, name: str, on_line: Callable[[str], None] = None):
+    '''Copy a process output stream line by line to sink and the log, keeping the last lines in tail'''
+    with pipe:
+        for raw in iter(lambda: pipe.readline(MAX_LINE_BYTES), b''):
+            line = raw.decode('utf-8', errors='replace')
+            if sink:
+                sink.write(line)
+                sink.flush()
+            line = line.rstrip('\r\n')
+            tail.append(line)
+            log.info(f'[{name}] {line}')
+            if on_line:
+                on_line(line)
+
+
+def _terminate(proc: subprocess.Popen, grace: float):
+    '''Send SIGTERM (so the process can clean up) and SIGKILL if it is still running after grace seconds'''
+    if proc.poll() is not None:
+        return
+    log.warning(f'Terminating process {proc.pid}')
+    proc.terminate()  # SIGTERM on posix
+    try:
+        proc.wait(grace)
+    except subprocess.TimeoutExpired:
+        log.warning(f'Process {proc.pid} did not exit {grace}s after SIGTERM, killing it')
+        if os.name == 'nt':
+            proc.kill()
+        else:  # kill its children too, they would keep the output pipes open
+            os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def _wait(proc: subprocess.Popen, deadline: Optional[float], timeout: Optional[float]):
+    '''Wait for the process to exit and reap it with wait4 to get its resource usage.
+    Returns the rusage, or None where wait4 is not available. Raises TimeoutExpired after the deadline (timeout seconds after the process started).'''
+    if not hasattr(os, 'wait4'):
+        proc.wait(None if deadline is None else max(0, deadline - time.monotonic()))
+        return None
+
+    while True:
+        pid, status, rusage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            # let Popen know the process was reaped
+            proc.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+            return rusage
+        if deadline is not None and time.monotonic() > deadline:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(POLL_INTERVAL)
+
+
+def _get_max_rss(rusage) -> Optional[int]:
+    # ru_maxrss is in kilobytes on linux and bytes on macOS
+    return rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024) if rusage else None
+
+
+def run_process(args: List[str], name: str = None, cwd: Path = None, env: dict = None, timeout: float = None,
+                check: bool = True, kill_grace: float = KILL_GRACE, tee: bool = True,
+                on_stderr_line: Callable[[str], None] = None) -> ProcessResult:
+    '''Run a process, streaming its stdout and stderr line by line to the log and, if tee is True,
+    to stdout and stderr. on_stderr_line is called with each stderr line from its pump thread.
+    The process is terminated if it runs longer than timeout seconds, or if the caller is interrupted.
+    Raises CalledProcessError if check is True and the process exits with a non-zero exit code.'''
+    name = name or Path(args[0]).name
+    out_tail, err_tail = deque(maxlen=TAIL_LINES), deque(maxlen=TAIL_LINES)
+
+    start = time.monotonic()
+    deadline = None if timeout is None else start + timeout
+
+    # a new session (process group) so the process and its children can be killed together
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env,
+                            start_new_session=os.name != 'nt')
+
+    out_sink, err_sink = (sys.stdout, sys.stderr) if tee else (None, None)
+    pumps = [threading.Thread(target=_pump, args=(proc.stdout, out_sink, out_tail, name), daemon=True),
+             threading.Thread(target=_pump, args=(proc.stderr, err_sink, err_tail, name, on_stderr_line),
+                              daemon=True)]
+    for pump in pumps:
+        pump.start()
+
+    timed_out = False
+    rusage = None
+    try:
+        rusage = _wait(proc, deadline, timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        log.error(f'{name} timed out after {timeout}s')
+        _terminate(proc, kill_grace)
+    except BaseException:  # cancelled, don't leave the process running
+        _terminate(proc, kill_grace)
+        raise
+    finally:
+        for pump in pumps:
+            pump.join()
+
+    result = ProcessResult(args, proc.returncode, out_tail, err_tail, time.monotonic() - start,
+                           user=rusage.ru_utime if rusage else None, system=rusage.ru_stime if rusage else None,
+                           max_rss=_get_max_rss(rusage), timed_out=timed_out)
+
+    if timed_out:
+        raise subprocess.TimeoutExpired(args, timeout, output='\n'.join(out_tail), stderr='\n'.join(err_tail))
+
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(result.returncode, args, output='\n'.join(out_tail),
+                                            stderr='\n'.join(err_tail))
+
+    return result
+
+
+def iter_process_output(args: List[str], name: str = None, cwd: Path = None, env: dict = None,
+                        chunk_size: int = CHUNK_SIZE, kill_grace: float = KILL_GRACE) -> Iterator[str]:
+    '''Run a process and yield its stdout in chunks as it is written, for output too large to hold in memory.
+    stderr is streamed to the log. The process is terminated if the caller stops iterating early.
+    Raises CalledProcessError if the process exits with a non-zero exit code.'''
+    name = name or Path(args[0]).name
+    err_tail = deque(maxlen=TAIL_LINES)
+
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd, env=env,
+                            start_new_session=os.name != 'nt')
+
+    pump = threading.Thread(target=_pump, args=(proc.stderr, None, err_tail, name), daemon=True)
+    pump.start()
+
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    try:
+        with proc.stdout:
+            for chunk in iter(lambda: proc.stdout.read1(chunk_size), b''):
+                if (text := decoder.decode(chunk)):
+                    yield text
+            if (text := decoder.decode(b'', final=True)):
+                yield text
+        proc.wait()
+    except BaseException:  # including GeneratorExit, don't leave the process running
+        _terminate(proc, kill_grace)
+        raise
+    finally:
+        pump.join()
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args, stderr='\n'.join(err_tail))
@@ -4,20 +4,97 @@
 # ------------------------------------
 # pylint: disable=logging-fstring-interpolation
 
+import contextlib
+import functools
+import hashlib
 import json
+import os
+import platform
+import re
 import shutil
 import subprocess
-import sys
+import tarfile
+import tempfile
+import time
 
 from pathlib import Path
+from typing import List, Optional
 
-from azure.cli.core.azclierror import ValidationError
+from azure.cli.core.azclierror import InvalidArgumentValueError, ValidationError
 
+from ._cache import CACHE_DISABLED, cache_key, evict_cache, get_cache_dir, read_cache_file
 from ._constants import IN_RUNNER
 from ._logging import get_logger
+from ._metrics import DEPLOYMENTS, TERRAFORM_PLAN_CHANGES, inc
+from ._process import iter_process_output, run_process
+from ._tfplan import ResourceChangeScanner, check_mass_replacement, summarize_resource_changes, write_plan_summary
+from ._tracing import span, traced
+from ._utils import atomic_write, file_lock, write_action_outputs
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+# snapshots of the .terraform directory and lock file after terraform init
+INIT_CACHE = 'terraform'
+INIT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+INIT_SNAPSHOT_SUFFIX = '.tar.gz'
+# written to the .terraform directory with the init key so an initialized directory isn't restored again
+INIT_MARKER_NAME = '.ade-runner-init'
+
+# provider plugins are shared by all actions using TF_PLUGIN_CACHE_DIR, terraform links them into .terraform
+PLUGIN_CACHE = 'terraform-plugins'
+PLUGIN_CACHE_LOCK_NAME = '.lock'
+ADE_RUNNER_TF_PLUGIN_CACHE_MAX_BYTES = 'ADE_RUNNER_TF_PLUGIN_CACHE_MAX_BYTES'
+DEFAULT_PLUGIN_CACHE_MAX_BYTES = 4 * 1024 * 1024 * 1024
+
+# seconds before a terraform command is terminated, by default commands don't time out
+ADE_RUNNER_TF_TIMEOUT = 'ADE_RUNNER_TF_TIMEOUT'
+
+# terraform -parallelism is chosen from the number of resources and recent throttling unless it is set
+# in the manifest or with this reserved action parameter (which isn't passed to terraform as a variable)
+PARALLELISM_PARAMETER = 'terraformParallelism'
+DEFAULT_PARALLELISM = 10
+MIN_PARALLELISM = 2
+MAX_PARALLELISM = 50
+RESOURCES_PER_WORKER = 10
+# the parallelism of recent runs, and if they were throttled, are saved here in storage
+RUNS_FILE_NAME = '.terraform-runs.json'
+RUNS_HISTORY = 20
+THROTTLE_WINDOW = 5
+THROTTLE_RECOVERY = 1.5
+
+# status codes and error codes of throttled requests in the provider errors terraform writes to stderr,
+# stdout isn't scanned as plan output can contain 429 or throttle in attribute values and names
+_THROTTLE_PATTERN = re.compile(r'StatusCode[=:]\s*429\b|\bstatus(?: code)?:? 429\b|429 Too Many Requests|TooManyRequests'
+                               r'|(?:Subscription|Resource|Tenant)RequestsThrottled', re.IGNORECASE)
+
+# the state is kept in storage (a file share) and copied to the temp directory while terraform runs
+STATE_FILE_NAME = 'environment.tfstate'
+STATE_CHECKSUM_SUFFIX = '.sha256'
+STATE_BACKUPS_DIR_NAME = '.tfstate-backups'
+STATE_BACKUPS = 10
+# held while the state is written back, so concurrent runs against the same storage can't overwrite each other
+STATE_LOCK_NAME = '.tfstate.lock'
+
+LOCK_FILE_NAME = '.terraform.lock.hcl'
+DATA_DIR_NAME = '.terraform'
+
+# provider and module sources and versions, and backends, are what terraform init installs and configures
+_SOURCE_PATTERN = re.compile(r'^\s*(source|version)\s*=\s*"([^"]*)"', re.MULTILINE)
+_BACKEND_PATTERN = re.compile(r'^\s*backend\s+"([^"]+)"', re.MULTILINE)
 
 log = get_logger(__name__)
 
+_stats = []  # resource usage of the terraform commands run by this process
+
+
+@functools.lru_cache(maxsize=None)
+def _get_terraform_executable() -> Optional[str]:
+    '''Get the full path to the terraform executable (resolved once per process)'''
+    return shutil.which('terraform')
+
 
 def check_terraform_install(raise_error=True):
     '''Checks if terraform is installed'''
@@ -39,7 +116,7 @@ def _parse_command(command):
         raise ValueError(f'command must be a string or list, not {type(command)}')
 
     # get full path to terraform executable
-    terraform = shutil.which('terraform')
+    terraform = _get_terraform_executable()
 
     # remove 'tf' or 'terraform' from the beginning args
     if args[0] == 'tf' or args[0] == 'terraform':
@@ -69,28 +146,358 @@ def _parse_command(command):
     return args
 
 
-def _execute_terraform(command):
+def get_plugin_cache_dir() -> Optional[Path]:
+    '''Get the shared provider plugin cache directory. Returns None if caching is disabled'''
+    return None if CACHE_DISABLED else get_cache_dir(PLUGIN_CACHE)
+
+
+@contextlib.contextmanager
+def plugin_cache_lock(exclusive: bool = False):
+    '''Lock the plugin cache. terraform init installs providers into the cache and eviction removes them,
+    so both need an exclusive lock. Restoring an init snapshot shares the lock so its providers aren't evicted.'''
+    if not (cache_dir := get_plugin_cache_dir()) or fcntl is None:
+        yield cache_dir
+        return
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_dir / PLUGIN_CACHE_LOCK_NAME, 'a+', encoding='utf-8') as f:
+        start = time.monotonic()
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        if (waited := time.monotonic() - start) > 1:
+            log.info(f'Waited {waited:.1f}s for the terraform plugin cache lock')
+        try:
+            yield cache_dir
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _get_plugin_version_lock_path(version: Path) -> Path:
+    # next to the version directory, hidden so it isn't listed as a version. It's never removed (eviction keeps it),
+    # so every process waiting on it locks the same file
+    return version.parent / f'.{version.name}{PLUGIN_CACHE_LOCK_NAME}'
+
+
+@contextlib.contextmanager
+def plugin_versions_in_use(working_dir: Path = None):
+    '''Mark the cached provider versions linked into a working directory as in use, with a shared lock on
+    each version's lock file, so eviction skips them while terraform runs without blocking init.'''
+    if not (cache_dir := get_plugin_cache_dir()) or fcntl is None:
+        yield
+        return
+
+    with contextlib.ExitStack() as stack:
+        for version in _get_used_plugin_versions((working_dir or Path.cwd()).resolve(), cache_dir):
+            try:
+                f = stack.enter_context(open(_get_plugin_version_lock_path(version), 'a+', encoding='utf-8'))
+            except OSError as e:
+                log.warning(f'Unable to mark provider {version.relative_to(cache_dir)} as in use: {e}')
+                continue
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH)
+        yield
+
+
+def _try_evict_plugin_version(version: Path) -> bool:
+    '''Remove a provider version from the cache unless a terraform command is using it'''
+    if fcntl is None:
+        shutil.rmtree(version, ignore_errors=True)
+        return True
+
+    lock_path = _get_plugin_version_lock_path(version)
+    with open(lock_path, 'a+', encoding='utf-8') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        shutil.rmtree(version, ignore_errors=True)
+    return True
+
+
+def _get_dir_size(path: Path) -> int:
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _get_plugin_versions(cache_dir: Path) -> List[Path]:
+    '''Get the provider version directories in the cache (host/namespace/type/version)'''
+    return [p for p in cache_dir.glob('*/*/*/*') if p.is_dir() and not p.name.startswith('.')]
+
+
+def _get_used_plugin_versions(working_dir: Path, cache_dir: Path) -> List[Path]:
+    '''Get the cached provider version directories linked into a working directory'''
+    used = []
+    providers = working_dir / DATA_DIR_NAME / 'providers'
+    for link in providers.glob('*/*/*/*/*') if providers.is_dir() else []:
+        if not link.is_symlink():
+            continue
+        # the link targets the platform directory inside the version directory
+        version = link.resolve().parent
+        if cache_dir in version.parents and version not in used:
+            used.append(version)
+    return used
+
+
+def _touch_plugin_versions(versions: List[Path]):
+    for version in versions:
+        with contextlib.suppress(OSError):
+            os.utime(version)
+
+
+def _get_plugin_cache_max_bytes() -> int:
+    try:
+        return int(os.environ.get(ADE_RUNNER_TF_PLUGIN_CACHE_MAX_BYTES, DEFAULT_PLUGIN_CACHE_MAX_BYTES))
+    except ValueError:
+        return DEFAULT_PLUGIN_CACHE_MAX_BYTES
+
+
+def evict_plugin_cache(keep: List[Path] = None, max_bytes: int = None) -> int:
+    '''Remove the least recently used provider versions until the plugin cache is smaller than max_bytes.
+    Call while holding the exclusive plugin cache lock, versions in use by running terraform commands are skipped.
+    Returns the number of versions removed.'''
+    if not (cache_dir := get_plugin_cache_dir()) or not cache_dir.is_dir():
+        return 0
+
+    max_bytes = _get_plugin_cache_max_bytes() if max_bytes is None else max_bytes
+    keep = keep or []
+
+    versions = [(v, _get_dir_size(v), v.stat().st_mtime) for v in _get_plugin_versions(cache_dir)]
+    total = sum(size for _, size, _ in versions)
+    removed = 0
+
+    for version, size, _ in sorted(versions, key=lambda v: v[2]):
+        if total <= max_bytes:
+            break
+        if version in keep:
+            continue
+        if not _try_evict_plugin_version(version):
+            log.info(f'Not evicting provider {version.relative_to(cache_dir)}, it is in use')
+            continue
+        log.info(f'Evicted provider {version.relative_to(cache_dir)} from the terraform plugin cache')
+        total -= size
+        removed += 1
+
+    return removed
+
+
+def get_plugin_cache_stats() -> dict:
+    '''Get the number of provider versions in the plugin cache and their size'''
+    if not (cache_dir := get_plugin_cache_dir()) or not cache_dir.is_dir():
+        return {'entries': 0, 'size': 0}
+    versions = _get_plugin_versions(cache_dir)
+    return {'entries': len(versions), 'size': sum(_get_dir_size(v) for v in versions)}
+
+
+def _get_terraform_env() -> dict:
+    env = os.environ.copy()
+    if (cache_dir := get_plugin_cache_dir()) and 'TF_PLUGIN_CACHE_DIR' not in os.environ:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        env['TF_PLUGIN_CACHE_DIR'] = str(cache_dir)
+    return env
+
+
+def _get_timeout() -> Optional[float]:
+    try:
+        return float(timeout) if (timeout := os.environ.get(ADE_RUNNER_TF_TIMEOUT)) else None
+    except ValueError:
+        return None
+
+
+def get_terraform_stats() -> List[dict]:
+    '''Get the wall, user and sys time and max RSS of each terraform command run by this process'''
+    return list(_stats)
+
+
+def _execute_terraform(command, working_dir: Path = None, timeout: float = None, check: bool = True):
     '''Runs a terraform command'''
     args = _parse_command(command)
     log.info(f'Executing terraform {args[1]}')
     log.info(f'Running terraform command: {" ".join(args)}')
-    proc = subprocess.run(args, stdout=sys.stdout, stderr=sys.stderr, check=True, text=True)
-    log.info(f'Done executing terraform {args[1]}')
-    return proc.returncode
-
 
-def terraform_init():
+    throttled = 0  # azure throttling (429) errors reported by the providers
+
+    def _on_stderr_line(line: str):
+        nonlocal throttled
+        if _THROTTLE_PATTERN.search(line):
+            throttled += 1
+
+    with span(f'terraform {args[1]}', command=args[1], workingDir=working_dir) as command_span:
+        try:
+            result = run_process(args, name=f'terraform {args[1]}', cwd=working_dir, env=_get_terraform_env(),
+                                 timeout=timeout or _get_timeout(), check=check,
+                                 on_stderr_line=_on_stderr_line)
+        except subprocess.CalledProcessError:
+            _stats.append({'command': args[1], 'exitCode': None, 'throttled': throttled})
+            command_span.set(throttled=throttled)
+            raise
+        command_span.set(exitCode=result.returncode, maxRss=result.max_rss, throttled=throttled)
+    stats = {'command': args[1], **result.to_dict(), 'throttled': throttled}
+    stats.pop('args')
+    _stats.append(stats)
+    log.info(f"Done executing terraform {args[1]} in {stats['wall']}s (user {stats['user']}s, sys {stats['sys']}s, "
+             f"max rss {stats['maxRss']} bytes)")
+    return result.returncode
+
+
+def terraform_init(working_dir: Path = None):
     '''Executes the terraform init command'''
     command = ['init']
-    return _execute_terraform(command)
+    working_dir = (working_dir or Path.cwd()).resolve()
+    with plugin_cache_lock(exclusive=True) as cache_dir:
+        exit_code = _execute_terraform(command, working_dir)
+        if cache_dir and exit_code == 0:
+            used = _get_used_plugin_versions(working_dir, cache_dir)
+            _touch_plugin_versions(used)
+            evict_plugin_cache(keep=used)
+    return exit_code
+
+
+def _get_terraform_sources(working_dir: Path) -> List[str]:
+    '''Get the provider and module sources and versions, and backends, declared in the configuration
+    and the local modules it uses transitively'''
+    root = working_dir.resolve()
+    dirs, sources = [], []
+    pending = [root]
+
+    while pending:
+        directory = pending.pop()
+        if directory in dirs or not directory.is_dir():
+            continue
+        dirs.append(directory)
+
+        for tf_file in sorted(directory.glob('*.tf')):
+            content = tf_file.read_text(encoding='utf-8')
+            rel = os.path.relpath(tf_file, root)
+            sources.extend(f'{rel}:backend={b}' for b in _BACKEND_PATTERN.findall(content))
+            for attr, value in _SOURCE_PATTERN.findall(content):
+                sources.append(f'{rel}:{attr}={value}')
+                if attr == 'source' and value.startswith(('./', '../')):
+                    pending.append((directory / value).resolve())
+
+    return sources
+
+
+def get_terraform_init_key(working_dir: Path) -> Optional[str]:
+    '''Get the init snapshot cache key for a configuration from the hash of its lock file, the provider and
+    module sources it declares, and the terraform executable. Returns None if caching is disabled.'''
+    if CACHE_DISABLED or not (terraform := _get_terraform_executable()):
+        return None
+
+    # the executable's size and modified time stand in for its version,
+    # running terraform version would cost more than checking the cache
+    stat = os.stat(terraform)
+    lock_file = working_dir / LOCK_FILE_NAME
+    lock = lock_file.read_text(encoding='utf-8') if lock_file.is_file() else 'missing'
+
+    return cache_key(f'{terraform}:{stat.st_size}:{stat.st_mtime_ns}', platform.system(), platform.machine(),
+                     lock, *_get_terraform_sources(working_dir))
+
+
+def _write_init_snapshot(key: str, working_dir: Path) -> Optional[Path]:
+    '''Pack the .terraform directory and lock file into the init cache'''
+    cache_dir = get_cache_dir(INIT_CACHE)
+    snapshot = cache_dir / f'{key}{INIT_SNAPSHOT_SUFFIX}'
+
+    # providers can be hundreds of megabytes so the archive is written to
+    # a temporary file in the cache directory instead of held in memory
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, prefix=f'.{snapshot.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        with tarfile.open(tmp, 'w:gz', compresslevel=6) as tar:
+            for name in (DATA_DIR_NAME, LOCK_FILE_NAME):
+                if (working_dir / name).exists():
+                    tar.add(working_dir / name, arcname=name)
+        os.replace(tmp, snapshot)
+    except (OSError, tarfile.TarError) as e:
+        Path(tmp).unlink(missing_ok=True)
+        log.info(f'Unable to write terraform init snapshot {key}: {e}')
+        return None
+
+    evict_cache(INIT_CACHE, max_bytes=INIT_CACHE_MAX_BYTES)
+    return snapshot
+
+
+def _restore_init_snapshot(snapshot: Path, working_dir: Path) -> bool:
+    '''Unpack an init snapshot into the working directory.
+    Returns False if the snapshot links to providers that have been evicted from the plugin cache.'''
+    shutil.rmtree(working_dir / DATA_DIR_NAME, ignore_errors=True)
+    with tarfile.open(snapshot, 'r:gz') as tar:
+        if hasattr(tarfile, 'tar_filter'):
+            tar.extractall(working_dir, filter='tar')
+        else:
+            tar.extractall(working_dir)  # the archive was created by _write_init_snapshot
+
+    for root, dirs, files in os.walk(working_dir / DATA_DIR_NAME):
+        for name in dirs + files:
+            if os.path.islink(path := os.path.join(root, name)) and not os.path.exists(path):
+                log.info(f'Terraform init snapshot links to a missing provider: {os.readlink(path)}')
+                return False
+
+    if (cache_dir := get_plugin_cache_dir()):
+        _touch_plugin_versions(_get_used_plugin_versions(working_dir, cache_dir))
+
+    return True
+
+
+def _read_init_marker(working_dir: Path) -> Optional[str]:
+    try:
+        return (working_dir / DATA_DIR_NAME / INIT_MARKER_NAME).read_text(encoding='utf-8').strip()
+    except OSError:
+        return None
+
+
+def _write_init_marker(working_dir: Path, key: str):
+    try:
+        (working_dir / DATA_DIR_NAME / INIT_MARKER_NAME).write_text(key, encoding='utf-8')
+    except OSError as e:
+        log.info(f'Unable to write terraform init marker: {e}')
+
+
+@traced('terraform init (cached)')
+def terraform_init_cached(working_dir: Path = None):
+    '''Initialize the working directory, restoring the init snapshot for the lock file, provider and module
+    sources, and terraform version instead of running terraform init when there is one'''
+    working_dir = (working_dir or Path.cwd()).resolve()
+
+    if not (key := get_terraform_init_key(working_dir)):
+        return terraform_init(working_dir)
+
+    if _read_init_marker(working_dir) == key:
+        log.info(f'{working_dir} is already initialized, skipping terraform init')
+        return 0
+
+    if (snapshot := read_cache_file(INIT_CACHE, key, INIT_SNAPSHOT_SUFFIX)):
+        try:
+            # hold the plugin cache lock so the providers the snapshot links to aren't evicted while restoring
+            with plugin_cache_lock():
+                restored = _restore_init_snapshot(snapshot, working_dir)
+            if restored:
+                _write_init_marker(working_dir, key)
+                log.info(f'Restored terraform init snapshot {key}, skipping terraform init')
+                return 0
+        except (OSError, tarfile.TarError) as e:
+            log.warning(f'Unable to restore terraform init snapshot {key}, running terraform init: {e}')
+
+    if (exit_code := terraform_init(working_dir)) == 0:
+        _write_init_snapshot(key, working_dir)
+        _write_init_marker(working_dir, key)
+
+    return exit_code
 
 
 def terraform_plan(state_file: Path, plan_file: Path, vars_file: Path,
-                   resource_group_name: str, destroy: bool = False):
-    '''Executes the terraform plan command'''
+                   resource_group_name: str, destroy: bool = False, working_dir: Path = None, parallelism: int = None):
+    '''Executes the terraform plan command.
+    Returns 0 if the plan has no changes, 2 if it has changes (-detailed-exitcode), or 1 if it failed.'''
     command = [
         'plan',
         '-compact-warnings',
+        '-detailed-exitcode',
         '-refresh=true',
         '-lock=true',
         f'-state={state_file}',
@@ -100,12 +507,75 @@ def terraform_plan(state_file: Path, plan_file: Path, vars_file: Path,
     ]
 
     if destroy:
-        command.insert(3, '-destroy')
+        command.insert(4, '-destroy')
+
+    if parallelism:
+        command.append(f'-parallelism={parallelism}')
 
-    return _execute_terraform(command)
+    with plugin_versions_in_use(working_dir):
+        return _execute_terraform(command, working_dir, check=False)
 
 
-def terraform_apply(state_file: Path, plan_file: Path):
+@traced('terraform show')
+def terraform_show_plan_summary(plan_file: Path, working_dir: Path = None) -> dict:
+    '''Summarize the resource changes in a saved plan. The output of terraform show -json is
+    scanned as it is written, so large plans are never held in memory.'''
+    args = _parse_command(['show', '-json', plan_file])
+    log.info(f'Running terraform command: {" ".join(args)}')
+    scanner = ResourceChangeScanner()
+    with plugin_versions_in_use(working_dir):
+        output = iter_process_output(args, name='terraform show', cwd=working_dir, env=_get_terraform_env())
+        return summarize_resource_changes(change for chunk in output for change in scanner.feed(chunk))
+
+
+def terraform_validate(template_dir: Path) -> List[str]:
+    '''Validate a terraform configuration without a backend or state. The configuration is copied
+    to a temporary directory so init doesn't write to the catalog. Returns the error messages.'''
+    with tempfile.TemporaryDirectory(prefix='ade-runner-validate-') as temp:
+        working_dir = Path(temp) / template_dir.name
+        shutil.copytree(template_dir, working_dir, ignore=shutil.ignore_patterns(DATA_DIR_NAME))
+        env = _get_terraform_env()
+
+        try:
+            with plugin_cache_lock(exclusive=True):
+                run_process(_parse_command(['init', '-backend=false', '-input=false']), name='terraform init',
+                            cwd=working_dir, env=env, timeout=_get_timeout(), tee=False)
+        except subprocess.CalledProcessError as e:
+            return [f'terraform init failed: {e.stderr.strip() or e.output.strip()}']
+
+        chunks = []
+        try:
+            with plugin_versions_in_use(working_dir):
+                for chunk in iter_process_output(_parse_command(['validate', '-json']), name='terraform validate',
+                                                 cwd=working_dir, env=env):
+                    chunks.append(chunk)
+        except subprocess.CalledProcessError as e:
+            if not chunks:
+                return [f'terraform validate failed: {e.stderr.strip()}']
+
+    try:
+        result = json.loads(''.join(chunks))
+    except ValueError:
+        return [f"terraform validate returned invalid json: {''.join(chunks)[:200]}"]
+
+    errors = []
+    for diagnostic in result.get('diagnostics', []):
+        if diagnostic.get('severity') != 'error':
+            continue
+        message = diagnostic.get('summary', '')
+        if (detail := diagnostic.get('detail')):
+            message += f': {detail}'
+        if (rng := diagnostic.get('range')):
+            message = f"{rng.get('filename')}:{rng.get('start', {}).get('line')}: {message}"
+        errors.append(message)
+
+    if not errors and not result.get('valid', True):
+        errors.append('terraform validate reported the configuration is not valid')
+
+    return errors
+
+
+def terraform_apply(state_file: Path, plan_file: Path, working_dir: Path = None, parallelism: int = None):
     '''Executes the terraform apply command'''
     command = [
         'apply',
@@ -115,27 +585,263 @@ def terraform_apply(state_file: Path, plan_file: Path):
         f'-state={state_file}',
         plan_file
     ]
-    return _execute_terraform(command)
+
+    if parallelism:
+        command.insert(-1, f'-parallelism={parallelism}')
+
+    with plugin_versions_in_use(working_dir):
+        return _execute_terraform(command, working_dir)
 
 
-def execute_terraform(storage_dir: Path, temp_dir: Path, parameters: dict, resource_group_name: str, destroy: bool = False):
-    '''Executes the terraform init, plan, and apply commands'''
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
 
-    state_file = storage_dir / 'environment.tfstate'
+
+def checkout_state(storage_dir: Path, temp_dir: Path) -> Optional[str]:
+    '''Copy the state file from storage to the temp directory, verifying its checksum.
+    Returns the checksum of the state, or None if there is no state yet.'''
+    state_file = storage_dir / STATE_FILE_NAME
+    local_file = temp_dir / STATE_FILE_NAME
+
+    if not state_file.is_file():
+        local_file.unlink(missing_ok=True)
+        return None
+
+    data = state_file.read_bytes()
+    checksum = _sha256(data)
+
+    checksum_file = state_file.with_name(state_file.name + STATE_CHECKSUM_SUFFIX)
+    if checksum_file.is_file() and checksum_file.read_text(encoding='utf-8').strip() != checksum:
+        try:  # the state was changed outside the runner or the write back was interrupted
+            json.loads(data)
+        except ValueError as e:
+            backups_dir = storage_dir / STATE_BACKUPS_DIR_NAME
+            raise ValidationError(f'Terraform state file {state_file} is corrupt (checksum mismatch)',
+                                  recommendation=f'Restore a backup from {backups_dir}') from e
+        log.warning(f'Terraform state file {state_file} does not match its checksum, using it anyway')
+        with file_lock(storage_dir / STATE_LOCK_NAME):  # so later runs don't warn again
+            if state_file.read_bytes() == data:
+                atomic_write(checksum_file, checksum, fsync=True)
+
+    local_file.write_bytes(data)
+    log.info(f'Copied terraform state to {local_file}')
+    return checksum
+
+
+def _backup_state(state_file: Path):
+    '''Copy the state file in storage to the backup ring, removing the oldest backups'''
+    backups_dir = state_file.parent / STATE_BACKUPS_DIR_NAME
+    try:
+        serial = json.loads(state_file.read_bytes()).get('serial', 0)
+    except (OSError, ValueError):
+        serial = 'unknown'
+
+    backups_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(state_file, backups_dir / f'{state_file.name}.{time.time_ns()}.{serial}')
+
+    backups = sorted(backups_dir.glob(f'{state_file.name}.*'), key=lambda b: b.stat().st_mtime_ns, reverse=True)
+    for backup in backups[STATE_BACKUPS:]:
+        backup.unlink(missing_ok=True)
+
+
+def _get_stored_checksum(state_file: Path) -> Optional[str]:
+    '''Hash the state in storage. The sidecar isn't used, it's stale if a write back was interrupted'''
+    return _sha256(state_file.read_bytes()) if state_file.is_file() else None
+
+
+def commit_state(storage_dir: Path, temp_dir: Path, checksum: Optional[str]) -> bool:
+    '''Write the state file in the temp directory back to storage if it changed. The previous state is
+    added to the backup ring and the new state is written to a temp file, fsynced, and renamed over it.
+    If the state in storage changed since it was checked out (checksum), another run wrote it, so the write
+    back is refused and the local state is kept in the backups directory. Returns True if the state was written.'''
+    state_file = storage_dir / STATE_FILE_NAME
+    local_file = temp_dir / STATE_FILE_NAME
+
+    if not local_file.is_file():
+        return False
+
+    data = local_file.read_bytes()
+    if (new_checksum := _sha256(data)) == checksum:
+        log.info('Terraform state is unchanged')
+        return False
+
+    with file_lock(storage_dir / STATE_LOCK_NAME):
+        if _get_stored_checksum(state_file) != checksum:
+            # not named like the backups, so the backup ring doesn't remove it
+            conflict_file = storage_dir / STATE_BACKUPS_DIR_NAME / f'{state_file.name}-conflict.{time.time_ns()}'
+            atomic_write(conflict_file, data, fsync=True)
+            raise ValidationError(f'Terraform state file {state_file} was changed by another run while terraform ran, '
+                                  'the state was not written back',
+                                  recommendation=f'Reconcile it with the state of this run, saved to {conflict_file}')
+
+        if state_file.is_file():
+            _backup_state(state_file)
+
+        atomic_write(state_file, data, fsync=True)
+        atomic_write(state_file.with_name(state_file.name + STATE_CHECKSUM_SUFFIX), new_checksum, fsync=True)
+    log.info(f'Wrote terraform state back to {state_file}')
+    return True
+
+
+def _read_runs(storage_dir: Path) -> List[dict]:
+    try:
+        with open(storage_dir / RUNS_FILE_NAME, 'r', encoding='utf-8') as f:
+            return json.load(f).get('runs', [])
+    except (OSError, ValueError, AttributeError):
+        return []
+
+
+def _record_run(storage_dir: Path, command: str, parallelism: int, resources: Optional[int]):
+    '''Save the parallelism of the last terraform command and how many throttling errors it reported'''
+    if not _stats or _stats[-1]['command'] != command:
+        return
+    runs = _read_runs(storage_dir)
+    runs.append({
+        'timestamp': time.time(),
+        'command': command,
+        'parallelism': parallelism,
+        'resources': resources,
+        'throttled': _stats[-1].get('throttled', 0)
+    })
+    try:
+        atomic_write(storage_dir / RUNS_FILE_NAME, json.dumps({'runs': runs[-RUNS_HISTORY:]}, indent=4))
+    except OSError as e:
+        log.info(f'Unable to save terraform run history: {e}')
+
+
+def _count_state_resources(state_file: Path) -> Optional[int]:
+    '''Count the managed resource instances in a state file'''
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return sum(len(r.get('instances', [])) for r in state.get('resources', []) if r.get('mode') == 'managed')
+
+
+def choose_parallelism(storage_dir: Path, resources: Optional[int], override: Optional[int] = None):
+    '''Choose -parallelism from the number of resources, reduced if recent runs were throttled.
+    Returns the parallelism and the reason it was chosen.'''
+    if override is not None and override != '':
+        try:
+            return max(1, int(override)), 'set explicitly'
+        except (TypeError, ValueError) as e:
+            raise InvalidArgumentValueError(f'{PARALLELISM_PARAMETER} must be an integer, got {override!r}') from e
+
+    if resources is None:
+        parallelism = DEFAULT_PARALLELISM
+        reason = 'the number of resources is unknown'
+    else:
+        parallelism = max(DEFAULT_PARALLELISM, min(MAX_PARALLELISM, -(-resources // RESOURCES_PER_WORKER)))
+        reason = f'{resources} resources'
+
+    # halve the parallelism of the last throttled run, and recover gradually with each run since that wasn't
+    runs = _read_runs(storage_dir)[-THROTTLE_WINDOW:]
+    throttled = [i for i, r in enumerate(runs) if r.get('throttled')]
+    if throttled:
+        last = throttled[-1]
+        cap = max(MIN_PARALLELISM, runs[last]['parallelism'] // 2)
+        for _ in runs[last + 1:]:
+            cap = int(cap * THROTTLE_RECOVERY)
+        if cap < parallelism:
+            parallelism = max(MIN_PARALLELISM, cap)
+            reason += f", throttled {runs[last]['throttled']} times {len(runs) - last} run(s) ago"
+
+    return parallelism, reason
+
+
+@traced('terraform', runner='Terraform')
+def execute_terraform(storage_dir: Path, temp_dir: Path, parameters: dict, resource_group_name: str, destroy: bool = False,
+                      working_dir: Path = None, parallelism: int = None):
+    '''Executes the terraform init, plan, and apply commands.
+    terraform init is skipped if there is an init snapshot for the configuration in the working directory,
+    and terraform apply is skipped if the plan has no changes.
+    terraform uses a copy of the state in the temp directory, which is written back to storage after apply.
+    parallelism (from the manifest) or the terraformParallelism parameter override the chosen -parallelism.'''
+    try:
+        exit_code, has_changes = _plan_and_apply(storage_dir, temp_dir, parameters, resource_group_name, destroy,
+                                                 working_dir, parallelism)
+    except BaseException:  # count every failure once, including init, timeouts and the mass replacement check
+        inc(DEPLOYMENTS, runner='Terraform', outcome='failed')
+        raise
+    inc(DEPLOYMENTS, runner='Terraform', outcome='succeeded' if has_changes else 'skipped')
+    return exit_code
+
+
+def _plan_and_apply(storage_dir: Path, temp_dir: Path, parameters: dict, resource_group_name: str, destroy: bool,
+                    working_dir: Path, parallelism: Optional[int]):
+    '''Run terraform init, plan and apply. Returns the exit code and True if the plan had changes'''
     plan_file = temp_dir / 'environment.tfplan'
     vars_file = temp_dir / 'environment.tfvars.json'
 
+    parameters = dict(parameters)
+    parallelism = parameters.pop(PARALLELISM_PARAMETER, None) or parallelism
+
     # write the environment variables to a file
     with open(vars_file, 'w') as f:
         json.dump(parameters, f, ensure_ascii=False, indent=4, sort_keys=True)
 
-    if (exit_code := terraform_init()) != 0:
+    if (exit_code := terraform_init_cached(working_dir)) != 0:
         raise ValidationError(f'Terraform init failed with exit code {exit_code}')
 
-    if (exit_code := terraform_plan(state_file, plan_file, vars_file, resource_group_name, destroy)) != 0:
-        raise ValidationError(f'Terraform plan failed with exit code {exit_code}')
+    checksum = checkout_state(storage_dir, temp_dir)
+    state_file = temp_dir / STATE_FILE_NAME
 
-    if (exit_code := terraform_apply(state_file, plan_file)) != 0:
-        raise ValidationError(f'Terraform apply failed with exit code {exit_code}')
+    resources = _count_state_resources(state_file)
+    plan_parallelism, reason = choose_parallelism(storage_dir, resources, parallelism)
+    log.info(f'Using terraform plan -parallelism={plan_parallelism} ({reason})')
 
-    return exit_code
+    try:
+        exit_code = terraform_plan(state_file, plan_file, vars_file, resource_group_name, destroy, working_dir,
+                                   plan_parallelism)
+    finally:
+        _record_run(storage_dir, 'plan', plan_parallelism, resources)
+    if exit_code not in (0, 2):
+        raise ValidationError(f'Terraform plan failed with exit code {exit_code}')
+
+    if exit_code == 0:
+        log.info('Terraform plan has no changes, skipping terraform apply')
+        _write_outputs(has_changes=False)
+        return 0, False
+
+    summary = None
+    try:
+        summary = terraform_show_plan_summary(plan_file, working_dir)
+        log.info(f"Terraform plan: {summary['create']} to create, {summary['update']} to update, "
+                 f"{summary['replace']} to replace, {summary['delete']} to delete")
+        write_plan_summary(summary)
+        for change in ('create', 'update', 'replace', 'delete'):
+            inc(TERRAFORM_PLAN_CHANGES, summary[change], change=change)
+        check_mass_replacement(summary)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:  # the summary is informational, still apply
+        log.warning(f'Unable to summarize the terraform plan: {e}')
+
+    if summary:
+        resources = sum(summary[a] for a in ('create', 'update', 'replace', 'delete'))
+    apply_parallelism, reason = choose_parallelism(storage_dir, resources, parallelism)
+    log.info(f'Using terraform apply -parallelism={apply_parallelism} ({reason})')
+
+    try:
+        if (exit_code := terraform_apply(state_file, plan_file, working_dir, apply_parallelism)) != 0:
+            raise ValidationError(f'Terraform apply failed with exit code {exit_code}')
+    except BaseException:
+        # apply writes the state as it goes, so save it even if apply failed, without hiding the apply error
+        try:
+            commit_state(storage_dir, temp_dir, checksum)
+        except (OSError, ValidationError) as e:
+            log.error(f'Unable to write back terraform state: {e}')
+        raise
+    finally:
+        _record_run(storage_dir, 'apply', apply_parallelism, resources)
+
+    commit_state(storage_dir, temp_dir, checksum)
+
+    _write_outputs(has_changes=True)
+    return exit_code, True
+
+
+def _write_outputs(has_changes: bool):
+    try:
+        write_action_outputs({'terraformPlanHasChanges': has_changes, 'terraformApplySkipped': not has_changes})
+    except OSError as e:
+        log.warning(f'Unable to write action outputs: {e}')
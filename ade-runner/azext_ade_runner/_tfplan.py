@@ -0,0 +1,204 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import json
+import os
+import re
+
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from ._logging import get_logger
+from ._utils import atomic_write
+
+PLAN_SUMMARY_FILE_NAME = 'plan-summary.json'
+
+# warn before apply if a plan replaces at least this many resources, or at least half of them
+ADE_RUNNER_TF_MASS_REPLACE = 'ADE_RUNNER_TF_MASS_REPLACE'
+DEFAULT_MASS_REPLACE = 10
+MASS_REPLACE_RATIO = 0.5
+
+ACTIONS = ('create', 'update', 'replace', 'delete')
+
+# a complete string, an unterminated string (more data needed), or a bracket
+_TOKEN_PATTERN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|"|[{}\[\]]')
+# the rest of a string that started in a previous chunk, up to its closing quote or a trailing backslash
+_STRING_BODY_PATTERN = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+_WHITESPACE_PATTERN = re.compile(r'[\s,]*')
+_COLON_PATTERN = re.compile(r'\s*:?\s*')
+
+_decoder = json.JSONDecoder()
+
+log = get_logger(__name__)
+
+
+class ResourceChangeScanner:
+    '''Incrementally scans the output of terraform show -json for the top level resource_changes array and
+    decodes its elements one at a time, so only the element being decoded is held in memory.
+    Everything else in the plan (planned values, prior state, configuration) is skipped without parsing.'''
+
+    def __init__(self):
+        self.buffer = ''
+        self.depth = 0
+        self.in_changes = False
+        self.in_string = False
+        self.element = None  # where the resource change being scanned starts in the buffer
+        self.element_parts = []  # the part of the resource change scanned from earlier chunks
+        self.element_depth = 0
+        self.done = False
+
+    def feed(self, chunk: str) -> Iterator[dict]:
+        '''Add a chunk of output and yield the resource changes completed by it. The brackets of a change are
+        counted as it arrives, so it's decoded once when it is complete rather than retried with every chunk'''
+        if self.done:
+            return
+        self.buffer += chunk
+        pos = 0
+
+        while not self.done:
+            if self.in_string:
+                pos = _STRING_BODY_PATTERN.match(self.buffer, pos).end()
+                if pos < len(self.buffer) and self.buffer[pos] == '"':
+                    self.in_string = False
+                    pos += 1
+                    continue
+                break
+
+            if self.in_changes and self.element is None:
+                pos = _WHITESPACE_PATTERN.match(self.buffer, pos).end()
+                if pos >= len(self.buffer):
+                    break
+                if self.buffer[pos] == ']':
+                    self.done = True
+                    break
+                if self.buffer[pos] not in '{[':  # not a resource change, but decode it to skip it
+                    try:
+                        change, pos = _decoder.raw_decode(self.buffer, pos)
+                    except ValueError:
+                        break  # the element is incomplete
+                    yield change
+                    continue
+                self.element = pos
+                self.element_depth = 0
+
+            if not (match := _TOKEN_PATTERN.search(self.buffer, pos)):
+                pos = len(self.buffer)
+                break
+
+            token = match.group()
+            if token == '"':  # the string continues in the next chunk
+                if self.depth == 1 and not self.in_changes:  # it may be the resource_changes key, keep it
+                    pos = match.start()
+                    break
+                # skip large strings (like state attributes) as they arrive instead of buffering them
+                self.in_string = True
+                pos = match.end()
+                continue
+
+            if self.element is not None:
+                if token in '{[':
+                    self.element_depth += 1
+                elif token in '}]':
+                    self.element_depth -= 1
+                pos = match.end()
+                if self.element_depth == 0:
+                    self.element_parts.append(self.buffer[self.element:pos])
+                    change, _ = _decoder.raw_decode(''.join(self.element_parts))
+                    self.element, self.element_parts = None, []
+                    yield change
+                continue
+
+            if token in '{[':
+                self.depth += 1
+            elif token in '}]':
+                self.depth -= 1
+            elif self.depth == 1 and token == '"resource_changes"':
+                colon = _COLON_PATTERN.match(self.buffer, match.end()).end()
+                if colon >= len(self.buffer):  # need to see what follows the key
+                    pos = match.start()
+                    break
+                if self.buffer[colon] == '[' and ':' in self.buffer[match.end():colon]:
+                    self.in_changes = True
+                    self.depth += 1
+                    pos = colon + 1
+                    continue
+
+            pos = match.end()
+
+        if self.done:
+            self.buffer = ''
+            return
+        # set aside the scanned part of the resource change, so it isn't copied again with every chunk
+        if self.element is not None:
+            self.element_parts.append(self.buffer[self.element:pos])
+            self.element = 0
+        self.buffer = self.buffer[pos:]
+
+
+def get_change_action(actions: list) -> Optional[str]:
+    '''Get the summary action (create, update, replace or delete) for a resource change's actions'''
+    if 'delete' in actions and 'create' in actions:
+        return 'replace'
+    for action in ('create', 'update', 'delete'):
+        if action in actions:
+            return action
+    return None  # no-op or read
+
+
+def summarize_resource_changes(changes: Iterable[dict]) -> dict:
+    '''Count the created, updated, replaced and deleted resources by type and list the replaced addresses'''
+    totals = dict.fromkeys(ACTIONS, 0)
+    by_type = {}
+    replaced, deleted = [], []
+    resources = 0
+
+    for change in changes:
+        if change.get('mode', 'managed') != 'managed':
+            continue
+        resources += 1
+        if not (action := get_change_action(change.get('change', {}).get('actions', []))):
+            continue
+        totals[action] += 1
+        counts = by_type.setdefault(change.get('type'), dict.fromkeys(ACTIONS, 0))
+        counts[action] += 1
+        if action == 'replace':
+            replaced.append(change.get('address'))
+        elif action == 'delete':
+            deleted.append(change.get('address'))
+
+    return {
+        'resources': resources,
+        **totals,
+        'byType': dict(sorted(by_type.items())),
+        'replaced': replaced,
+        'deleted': deleted
+    }
+
+
+def _get_mass_replace_threshold() -> int:
+    try:
+        return int(os.environ.get(ADE_RUNNER_TF_MASS_REPLACE, DEFAULT_MASS_REPLACE))
+    except ValueError:
+        return DEFAULT_MASS_REPLACE
+
+
+def check_mass_replacement(summary: dict) -> bool:
+    '''Log a warning and return True if the plan replaces many resources'''
+    replaced, resources = summary['replace'], summary['resources']
+    if replaced >= _get_mass_replace_threshold() or (replaced > 1 and replaced >= resources * MASS_REPLACE_RATIO):
+        shown = ', '.join(summary['replaced'][:10]) + (', ...' if replaced > 10 else '')
+        log.warning(f'The terraform plan replaces {replaced} of {resources} resources: {shown}')
+        return True
+    return False
+
+
+def write_plan_summary(summary: dict, output_dir: Path = None) -> Path:
+    '''Write the plan summary to the output directory'''
+    if output_dir is None:
+        from ._constants import OUTPUT_DIR as output_dir
+    summary_file = output_dir / PLAN_SUMMARY_FILE_NAME
+    atomic_write(summary_file, json.dumps(summary, indent=4))
+    return summary_file
@@ -0,0 +1,201 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+# pylint: disable=logging-fstring-interpolation
+
+import asyncio
+import atexit
+import contextlib
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from pathlib import Path
+
+from ._constants import IN_RUNNER
+from ._logging import get_logger
+from ._metrics import METRICS_ENABLED, PHASE_DURATION, observe
+from ._utils import update_file
+
+# spans are written to this file in the output directory as chrome trace events (open it in https://ui.perfetto.dev),
+# and their durations are added to the phase duration histogram in the metrics file
+TRACE_FILE_NAME = 'trace.json'
+
+# set to 1 to trace outside the runner, or 0 to stop tracing in the runner
+ADE_RUNNER_TRACE = 'ADE_RUNNER_TRACE'
+TRACING_ENABLED = os.environ.get(ADE_RUNNER_TRACE, '1' if IN_RUNNER else '0').lower() not in ('0', 'false', '')
+
+# the most spans kept per process, so a long running process can't grow the trace without bound
+MAX_EVENTS = 100000
+
+log = get_logger(__name__)
+
+_current = contextvars.ContextVar('ade_runner_span', default=None)
+_ids = itertools.count(1)
+_lock = threading.Lock()
+_events = []
+_tracks = {}  # (thread id, task id): track id
+_registered = False
+
+
+class Span:
+    '''A timed phase of an action. Attributes are shown in the trace viewer when the span is selected'''
+    __slots__ = ('name', 'category', 'attributes', 'id', 'parent', 'track', 'start', '_start')
+
+    def __init__(self, name: str, category: str, attributes: dict, parent: 'Span' = None):
+        self.name = name
+        self.category = category
+        self.attributes = attributes
+        self.id = next(_ids)
+        self.parent = parent
+        self.track = _get_track() if TRACING_ENABLED else None
+        self.start = time.time_ns() // 1000  # wall clock, so spans from different processes line up
+        self._start = time.perf_counter()
+
+    def set(self, **attributes):
+        '''Add attributes to the span'''
+        self.attributes.update(attributes)
+
+    def get(self, name: str):
+        '''Get an attribute of the span, or of the nearest parent span that has it'''
+        current = self
+        while current:
+            if name in current.attributes:
+                return current.attributes[name]
+            current = current.parent
+        return None
+
+    def _event(self, duration: float) -> dict:
+        args = {k: v if isinstance(v, (str, int, float, bool)) or v is None else str(v)
+                for k, v in self.attributes.items()}
+        if self.parent:
+            args['parent'] = f'{self.parent.name} ({self.parent.id})'
+        return {'name': self.name, 'cat': self.category, 'ph': 'X', 'ts': self.start,
+                'dur': round(duration * 1e6, 1),
+                'pid': os.getpid(), 'tid': self.track, 'args': args}
+
+
+class _NoopSpan:  # pylint: disable=too-few-public-methods
+    '''Yielded by span when tracing and metrics are off'''
+    __slots__ = ()
+
+    def set(self, **attributes):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def _get_track() -> int:
+    '''Get the trace track (tid) for the current thread and asyncio task. Spans on the same track nest
+    by time, so concurrent tasks and executor threads each get their own track'''
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # no running event loop
+        task = None
+    key = (threading.get_ident(), id(task) if task else None)
+    with _lock:
+        if (track := _tracks.get(key)) is None:
+            track = _tracks[key] = len(_tracks) + 1
+            name = threading.current_thread().name + (f' {task.get_name()}' if task else '')
+            _events.append({'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': track,
+                            'args': {'name': name}})
+    return track
+
+
+def _record(event: dict):
+    global _registered  # pylint: disable=global-statement
+    with _lock:
+        if len(_events) < MAX_EVENTS:
+            _events.append(event)
+        if not _registered:
+            _registered = True
+            atexit.register(write_trace)
+
+
+@contextlib.contextmanager
+def span(name: str, category: str = 'ade-runner', **attributes):
+    '''Time the enclosed code as a span nested in the current span. Yields the span, call set to add attributes'''
+    if not TRACING_ENABLED and not METRICS_ENABLED:
+        yield _NOOP_SPAN
+        return
+
+    current = Span(name, category, attributes, parent=_current.get())
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes['error'] = type(e).__name__
+        raise
+    finally:
+        _current.reset(token)
+        duration = time.perf_counter() - current._start  # pylint: disable=protected-access
+        if TRACING_ENABLED:
+            _record(current._event(duration))  # pylint: disable=protected-access
+        observe(PHASE_DURATION, duration, phase=name, runner=current.get('runner'),
+                status='error' if 'error' in current.attributes else 'ok')
+
+
+def traced(name: str = None, category: str = 'ade-runner', **attributes):
+    '''Decorate a function (or coroutine function) to run it in a span named after the function'''
+    def decorator(func):
+        span_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, category, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, category, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def bind_context(func, *args, **kwargs):
+    '''Bind a function to the current context, so spans it starts in an executor thread nest in the current span'''
+    return functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+
+
+def write_trace(path: Path = None):
+    '''Add this process's spans to the trace file in the output directory. Spans from earlier az
+    invocations (and worker processes) of the same action are kept, so the file is one timeline'''
+    with _lock:
+        events = list(_events)
+        _events.clear()
+        _tracks.clear()
+    if not any(e['ph'] == 'X' for e in events):
+        return None
+
+    if path is None:
+        from ._constants import OUTPUT_DIR
+        path = OUTPUT_DIR / TRACE_FILE_NAME
+
+    events.insert(0, {'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0,
+                      'args': {'name': ' '.join(['az'] + sys.argv[1:4])}})
+
+    def _merge(content):
+        try:
+            existing = json.loads(content).get('traceEvents', []) if content else []
+        except (ValueError, AttributeError):
+            existing = []
+        return json.dumps({'traceEvents': existing + events, 'displayTimeUnit': 'ms'})
+
+    try:
+        update_file(path, _merge)
+        log.info(f'Wrote {len(events)} trace events to {path}')
+    except OSError as e:
+        log.warning(f'Unable to write trace to {path}: {e}')
+        return None
+    return path
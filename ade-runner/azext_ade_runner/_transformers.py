@@ -3,8 +3,20 @@
 # Licensed under the MIT License.
 # ------------------------------------
 
-# from collections import OrderedDict
+from collections import OrderedDict
 
 from ._logging import get_logger
 
 log = get_logger(__name__)
+
+
+def transform_run_batch_output(result):
+    return [OrderedDict([('CatalogItem', r['catalogItem']), ('ResourceGroup', r['resourceGroup']),
+                         ('Status', r['status']), ('Duration', r['duration']),
+                         ('Error', r['error'] or '')]) for r in result]
+
+
+def transform_validate_output(result):
+    return [OrderedDict([('CatalogItem', r['catalogItem']), ('Runner', r['runner'] or ''),
+                         ('Status', r['status']), ('Duration', r['duration']),
+                         ('Errors', '; '.join(r['errors']))]) for r in result]
@@ -4,16 +4,25 @@
 # ------------------------------------
 # pylint: disable=logging-fstring-interpolation
 
-from pathlib import Path
-from typing import Union
+import contextlib
+import json
+import os
+import tempfile
 
-import yaml
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Optional, Union
 
 from azure.cli.core.azclierror import FileOperationError, ValidationError
-from azure.cli.core.util import get_file_yaml, read_file_content
+from azure.cli.core.util import read_file_content
 
 from ._logging import get_logger
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
 log = get_logger(__name__)
 
 
@@ -46,12 +55,125 @@ def get_yaml_file_path(dirpath: Union[str, Path], file: str, required=True):
     return file_path
 
 
-def get_yaml_file_contents(path: Union[str, Path]):
-    '''Get the contents of a yaml file'''
+@lru_cache(maxsize=None)
+def get_extension_version() -> str:
+    '''Get the installed extension's version from its wheel metadata (without loading the cli's extensions).
+    Returns dev if the extension isn't installed from a wheel'''
+    from ._constants import EXT_NAME_CLEAN
+    ext_dir = Path(__file__).resolve().parent.parent
+    for metadata in ext_dir.glob(f'{EXT_NAME_CLEAN}-*.dist-info/METADATA'):
+        try:
+            with open(metadata, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.startswith('Version:'):
+                        return line.split(':', 1)[1].strip()
+        except OSError:
+            pass
+    return 'dev'
+
+
+@lru_cache(maxsize=None)
+def get_yaml_loader():
+    '''Get the libyaml based safe loader if pyyaml was built with libyaml, otherwise the pure python loader'''
+    import yaml
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    log.debug(f'Using yaml loader {loader.__name__}')
+    return loader
+
+
+def _decode_file_content(path: Path, content: bytes) -> str:
+    # the same encodings (in the same order) as azure.cli.core.util.read_file_content
+    for encoding in ['utf-8-sig', 'utf-8', 'utf-16', 'utf-16le', 'utf-16be']:
+        try:
+            return content.decode(encoding)
+        except UnicodeError:
+            pass
+    raise FileOperationError(f'Failed to decode file {path} - unknown decoding')
+
+
+def get_yaml_file_contents(path: Union[str, Path], loader=None):
+    '''Get the contents of a yaml file. The file is read once and parsed with libyaml when it is available'''
+    import yaml
     path = (path if isinstance(path, Path) else Path(path)).resolve()
-    if not path.is_file():
-        raise FileOperationError(f'Could not find yaml file at {path}')
-    return get_file_yaml(path, throw_on_empty=True)
+    try:
+        with open(path, 'rb') as f:
+            content = f.read()
+    except (FileNotFoundError, IsADirectoryError) as e:
+        raise FileOperationError(f'Could not find yaml file at {path}') from e
+
+    if not (text := _decode_file_content(path, content)):
+        raise FileOperationError(f"Failed to parse file '{path}' with exception:\nNo content in the file.")
+    try:
+        return yaml.load(text, Loader=loader or get_yaml_loader())
+    except yaml.YAMLError as e:
+        raise FileOperationError(f"Failed to parse file '{path}' with exception:\n{e}") from e
+
+
+def atomic_write(path: Union[str, Path], data: Union[str, bytes], fsync: bool = False):
+    '''Write data to a file by writing a temporary file in the same directory and renaming it over the target'''
+    path = path if isinstance(path, Path) else Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data.encode('utf-8') if isinstance(data, str) else data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+@contextlib.contextmanager
+def file_lock(path: Path):
+    '''Hold an exclusive lock on a lock file (created if it doesn't exist) while the enclosed code runs.
+    Locks are advisory and only taken where fcntl is available'''
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def update_file(path: Path, update: Callable[[Optional[str]], str]):
+    '''Read a file, update it and write it back atomically while holding a lock, so processes adding to the
+    same file don't lose each other's changes. update is called with the content (None if the file doesn't
+    exist) and returns the new content'''
+    with file_lock(path.with_name(f'.{path.name}.lock')):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            content = None
+        atomic_write(path, update(content))
+
+
+def write_action_outputs(outputs: dict, output_dir: Path = None) -> Path:
+    '''Add outputs to the action's outputs.json in the output directory, in the same
+    format as ARM deployment outputs ({name: {type, value}}). Returns the path to the file.'''
+    if output_dir is None:
+        from ._constants import OUTPUT_DIR as output_dir
+
+    outputs_file = output_dir / 'outputs.json'
+    try:
+        with open(outputs_file, 'r', encoding='utf-8') as f:
+            existing = json.load(f)
+    except (OSError, ValueError):
+        existing = {}
+
+    for name, value in outputs.items():
+        kind = 'bool' if isinstance(value, bool) else 'int' if isinstance(value, int) \
+            else 'string' if isinstance(value, str) else 'array' if isinstance(value, list) else 'object'
+        existing[name] = {'type': kind, 'value': value}
+
+    atomic_write(outputs_file, json.dumps(existing, indent=4))
+    return outputs_file
 
 
 def _validate_file_path(path: Union[str, Path], name: str = None) -> Path:
@@ -4,6 +4,7 @@
 # ------------------------------------
 # pylint: disable=line-too-long, logging-fstring-interpolation, unused-argument
 
+import json
 import os
 
 from pathlib import Path
@@ -14,16 +15,16 @@ from azure.cli.core.azclierror import (ArgumentUsageError, CLIError, InvalidArgu
                                        MutuallyExclusiveArgumentError, RequiredArgumentMissingError, ValidationError)
 from azure.cli.core.commands.validators import validate_file_or_dict
 
-from ._constants import EXT_REPO_NAME, EXT_REPO_OWNER
-from ._data import Manifest
+from ._catalog import get_catalog_items, get_manifest, validate_manifest_runner
+from ._constants import ADE_ENVIRONMENT_RESOURCE_GROUP_NAME, EXT_REPO_NAME, EXT_REPO_OWNER
 from ._github import get_github_latest_release_version, github_release_version_exists
 from ._logging import get_logger
-from ._utils import get_yaml_file_contents, get_yaml_file_path
+from ._tracing import traced
 
 log = get_logger(__name__)
 
 
-def _get_arg_or_env(cmd, ns, arg_name: str, is_path: bool = False) -> Union[str, Path]:
+def _get_arg_or_env(cmd, ns, arg_name: str, is_path: bool = False, required: bool = True) -> Union[str, Path]:
     '''Get argument value from command line or environment variable.
     arg_name will be capitalized and prefixed with ADE_ to get the environment variable name.
     '''
@@ -41,6 +42,8 @@ def _get_arg_or_env(cmd, ns, arg_name: str, is_path: bool = False) -> Union[str,
                 arg_value = Path(arg_value).resolve()
             setattr(ns, arg_name, arg_value)
             return arg_value
+        if not required:
+            return None
         cmd_arg_name = '/'.join(cmd.arguments[arg_name].type.settings['options_list'])
         raise RequiredArgumentMissingError(f"Missing required argument '{cmd_arg_name}'",
                                            recommendation=f"Please provide a value for '{cmd_arg_name}' "
@@ -48,77 +51,162 @@ def _get_arg_or_env(cmd, ns, arg_name: str, is_path: bool = False) -> Union[str,
     raise CLIError(f'Invalid argument {arg_name}')
 
 
+@traced('validate catalog', category='validator')
 def catalog_validator(cmd, ns):
     catalog = _get_arg_or_env(cmd, ns, 'catalog', is_path=True)
     if not catalog.is_dir():
         raise InvalidArgumentValueError(f'Invalid catalog path: {catalog}')
 
 
+@traced('validate catalog item', category='validator')
 def catalog_item_validator(cmd, ns):
     catalog_item = _get_arg_or_env(cmd, ns, 'catalog_item', is_path=True)
     if not catalog_item.is_dir():
         raise InvalidArgumentValueError(f'Invalid catalog item path: {catalog_item}')
 
     if hasattr(ns, 'manifest'):
-        yaml_path = get_yaml_file_path(catalog_item, 'manifest', required=True)
-        yaml_content = get_yaml_file_contents(yaml_path)
-        ns.manifest = Manifest(yaml_content, yaml_path)
+        ns.manifest = get_manifest(catalog_item)
+
+
+@traced('validate catalog items', category='validator')
+def catalog_items_validator(cmd, ns):
+    ns.catalog_items = get_catalog_items(ns.catalog, ns.catalog_items)
+    if not ns.catalog_items:
+        raise InvalidArgumentValueError(f'No catalog items found in catalog: {ns.catalog}')
+
+    if hasattr(ns, 'manifests'):
+        ns.manifests = [get_manifest(catalog_item) for catalog_item in ns.catalog_items]
 
 
 def action_name_validator(cmd, ns):
     _get_arg_or_env(cmd, ns, 'action_name')
 
 
-def action_parameters_validator(cmd, ns):
-    action_params = _get_arg_or_env(cmd, ns, 'action_parameters')
-    ns.action_parameters = validate_file_or_dict(action_params)
+@traced('validate action parameters', category='validator')
+def action_parameters_validator(cmd, ns, required: bool = True):
+    action_params = _get_arg_or_env(cmd, ns, 'action_parameters', required=required)
+    ns.action_parameters = _parse_action_parameters(action_params) if action_params else {}
+
+
+def _parse_action_parameters(action_params: str) -> dict:
+    '''Parse the action parameters. Inline json (ADE_ACTION_PARAMETERS) is parsed once without
+    probing the filesystem, anything else is treated as a file path or json by validate_file_or_dict'''
+    if action_params.lstrip().startswith('{'):
+        try:
+            parameters = json.loads(action_params)
+        except ValueError:
+            parameters = validate_file_or_dict(action_params)  # reports the json error
+    else:
+        parameters = validate_file_or_dict(action_params)
+
+    if not isinstance(parameters, dict):
+        raise InvalidArgumentValueError('Action parameters must be a json object of parameter names and values')
+    return parameters
 
 
 def environment_resource_group_validator(cmd, ns):
     _get_arg_or_env(cmd, ns, 'environment_resource_group_name')
 
 
+@traced('validate resource groups', category='validator')
+def resource_groups_validator(cmd, ns):
+    if not ns.resource_groups:
+        if (resource_group := os.environ.get(ADE_ENVIRONMENT_RESOURCE_GROUP_NAME, None)):
+            ns.resource_groups = [resource_group]
+        else:
+            raise RequiredArgumentMissingError("Missing required argument '--resource-groups/-g'",
+                                               recommendation="Please provide a value for '--resource-groups/-g' "
+                                               f"or set environment variable: '{ADE_ENVIRONMENT_RESOURCE_GROUP_NAME}'")
+
+    if len(ns.resource_groups) == 1:
+        ns.resource_groups = ns.resource_groups * len(ns.catalog_items)
+    elif len(ns.resource_groups) != len(ns.catalog_items):
+        raise ArgumentUsageError(f'Found {len(ns.catalog_items)} catalog items but {len(ns.resource_groups)} '
+                                 'resource groups',
+                                 recommendation='Provide a single resource group for all catalog items, '
+                                 'or one resource group for each catalog item')
+
+
+def concurrency_validator(cmd, ns):
+    if ns.concurrency < 1:
+        raise InvalidArgumentValueError('--concurrency must be greater than 0')
+
+
+@traced('validate ade-runner run', category='validator')
 def ade_runner_run_command_validator(cmd, ns):
     catalog_validator(cmd, ns)
     catalog_item_validator(cmd, ns)
 
-    runner: str = ns.manifest.runner
-    template_path: Path = ns.manifest.template_path
-
-    if runner:  # if runner is specified, validate template_path is the correct type for the runner
-        if runner.lower() == 'arm' or runner.lower() == 'bicep':
-            if template_path.suffix != '.json' and template_path.suffix != '.bicep':
-                raise ArgumentUsageError(f'Invalid template file for {runner} runner: {template_path}',
-                                         recommendation='Please provide a valid ARM/Bicep template '
-                                         'file with .json or .bicep extension')
-        elif runner.lower() == 'terraform' or runner.lower() == 'tf':
-            if template_path.suffix != '.tf':
-                raise ArgumentUsageError(f'Invalid template file for {runner} runner: {template_path}',
-                                         recommendation='Please provide a valid Terraform template '
-                                         'file with .tf extension')
-        else:
-            raise ArgumentUsageError(f'Invalid runner: {runner}',
-                                     recommendation='Please provide a valid runner: ARM, Bicep, or Terraform')
-
-    elif template_path:  # if template_path is specified, validate runner is the correct type for the template_path
-        if template_path.suffix == '.tf' or str(template_path).lower().endswith('.tf.json'):
-            runner = 'Terraform'
-        elif template_path.suffix == '.bicep':
-            runner = 'Bicep'
-        elif template_path.suffix == '.json':
-            runner = 'ARM'
-        else:
-            raise ArgumentUsageError(f'Invalid template file: {template_path}',
-                                     recommendation='Please provide a valid ARM/Bicep/Terraform template '
-                                     'file with .json/.bicep/.tf extension')
-
-    # TODO: Add validation for other runners
+    validate_manifest_runner(ns.manifest)
 
     action_name_validator(cmd, ns)
     action_parameters_validator(cmd, ns)
     environment_resource_group_validator(cmd, ns)
 
 
+@traced('validate ade-runner run-batch', category='validator')
+def ade_runner_run_batch_command_validator(cmd, ns):
+    catalog_validator(cmd, ns)
+    catalog_items_validator(cmd, ns)
+
+    for manifest in ns.manifests:
+        validate_manifest_runner(manifest)
+
+    action_name_validator(cmd, ns)
+    action_parameters_validator(cmd, ns, required=False)
+    resource_groups_validator(cmd, ns)
+    concurrency_validator(cmd, ns)
+
+
+@traced('validate ade-runner cache warm', category='validator')
+def cache_warm_command_validator(cmd, ns):
+    catalog_validator(cmd, ns)
+    catalog_items_validator(cmd, ns)
+    concurrency_validator(cmd, ns)
+
+
+@traced('validate ade-runner validate', category='validator')
+def validate_command_validator(cmd, ns):
+    catalog_validator(cmd, ns)
+    catalog_items_validator(cmd, ns)
+    if ns.concurrency is not None:  # default: the number of cpus
+        concurrency_validator(cmd, ns)
+    if ns.report:
+        ns.report = Path(ns.report).resolve()
+        if not ns.report.parent.is_dir():
+            raise InvalidArgumentValueError(f'Invalid report path, directory does not exist: {ns.report.parent}')
+
+
+def metrics_merge_command_validator(cmd, ns):
+    from glob import glob
+    from ._metrics import METRICS_FILE_NAME
+
+    files = []
+    for pattern in ns.files:
+        path = Path(pattern).resolve()
+        if path.is_dir():
+            # the metrics file of each action is in its output directory
+            files.extend(sorted(path.rglob(METRICS_FILE_NAME)))
+        elif path.is_file():
+            files.append(path)
+        elif (matches := sorted(glob(pattern, recursive=True))):
+            files.extend(Path(m).resolve() for m in matches if Path(m).is_file())
+        else:
+            raise InvalidArgumentValueError(f'Invalid metrics file path: {pattern}')
+
+    if ns.outfile:
+        ns.outfile = Path(ns.outfile).resolve()
+        if not ns.outfile.parent.is_dir():
+            raise InvalidArgumentValueError(f'Invalid outfile path, directory does not exist: {ns.outfile.parent}')
+
+    # the merged file may be in a directory being merged
+    ns.files = [f for f in dict.fromkeys(files) if f != ns.outfile]
+    if not ns.files:
+        raise InvalidArgumentValueError('No metrics files found',
+                                        recommendation=f'Provide {METRICS_FILE_NAME} files, or directories '
+                                        'that contain them')
+
+
 def source_version_validator(cmd, ns):
     if ns.version:
         if ns.prerelease:
@@ -4,7 +4,7 @@
 # ------------------------------------
 
 from ._constants import EXT_NAME, EXT_NAME_CLEAN
-from ._validators import ade_runner_run_command_validator
+from ._lazy import lazy_transformer, lazy_validator
 
 
 def load_command_table(self, _):  # pylint: disable=too-many-statements
@@ -16,4 +16,19 @@ def load_command_table(self, _):  # pylint: disable=too-many-statements
         # g.custom_command('test', f'{EXT_NAME_CLEAN}_tests')
         g.custom_command('version', f'{EXT_NAME_CLEAN}_version')
         g.custom_command('upgrade', f'{EXT_NAME_CLEAN}_upgrade')
-        g.custom_command('run', f'{EXT_NAME_CLEAN}_run', validator=ade_runner_run_command_validator)
+        g.custom_command('run', f'{EXT_NAME_CLEAN}_run', validator=lazy_validator('ade_runner_run_command_validator'))
+        g.custom_command('run-batch', f'{EXT_NAME_CLEAN}_run_batch',
+                         validator=lazy_validator('ade_runner_run_batch_command_validator'),
+                         table_transformer=lazy_transformer('transform_run_batch_output'))
+        g.custom_command('validate', f'{EXT_NAME_CLEAN}_validate',
+                         validator=lazy_validator('validate_command_validator'),
+                         table_transformer=lazy_transformer('transform_validate_output'))
+
+    with self.command_group(f'{EXT_NAME} cache') as g:
+        g.custom_command('stats', f'{EXT_NAME_CLEAN}_cache_stats')
+        g.custom_command('purge', f'{EXT_NAME_CLEAN}_cache_purge', confirmation='Are you sure you want to delete the cache?')
+        g.custom_command('warm', f'{EXT_NAME_CLEAN}_cache_warm', validator=lazy_validator('cache_warm_command_validator'))
+
+    with self.command_group(f'{EXT_NAME} metrics') as g:
+        g.custom_command('merge', f'{EXT_NAME_CLEAN}_metrics_merge',
+                         validator=lazy_validator('metrics_merge_command_validator'))
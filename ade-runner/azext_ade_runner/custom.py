@@ -4,19 +4,21 @@
 # ------------------------------------
 # pylint: disable=line-too-long, logging-fstring-interpolation, too-many-locals, too-many-statements, unused-argument
 
+import asyncio
 import json
 import os
+import time
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import List
 
 from azure.cli.core.azclierror import CLIError
 from azure.cli.core.extension.operations import show_extension, update_extension
 from packaging.version import parse as parse_version
 
-from ._arm import deploy_arm_template_at_resource_group
 from ._constants import EXT_NAME, IN_RUNNER
 from ._data import Manifest
-from ._github import get_github_latest_release_version, get_github_release
 from ._logging import get_logger
 
 log = get_logger(__name__)
@@ -27,18 +29,196 @@ log = get_logger(__name__)
 
 def ade_runner_run(cmd, environment_resource_group_name: str = None, runner: str = None,
                    catalog: Path = None, catalog_item: Path = None, manifest: Manifest = None,
-                   action_name: str = None, action_parameters: dict = None):
+                   action_name: str = None, action_parameters: dict = None,
+                   skip_unchanged: bool = False, verify_resource_group: bool = False):
 
-    params = []
+    _run_action(cmd, environment_resource_group_name, manifest, action_name, action_parameters,
+                skip_unchanged=skip_unchanged, verify_resource_group=verify_resource_group)
 
-    for key, value in action_parameters.items():
-        params.append(f'{key}={value if isinstance(value, str) else json.dumps(value)}')
 
-    if action_name.lower() == 'deploy':
-        log.info('Deploying environment...')
-        _, _ = deploy_arm_template_at_resource_group(cmd, environment_resource_group_name,
-                                                     template_file=manifest.template_path,
-                                                     parameters=[params])
+def ade_runner_run_batch(cmd, catalog: Path = None, catalog_items: List[Path] = None, manifests: List[Manifest] = None,
+                         resource_groups: List[str] = None, action_name: str = None, action_parameters: dict = None,
+                         concurrency: int = 4, skip_unchanged: bool = False, verify_resource_group: bool = False):
+
+    log.info(f'Running action {action_name} for {len(manifests)} catalog items with concurrency {concurrency}')
+
+    async def _run(semaphore: asyncio.Semaphore, manifest: Manifest, resource_group_name: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                _, skipped = await _run_action_async(cmd, resource_group_name, manifest, action_name, action_parameters,
+                                                     skip_unchanged=skip_unchanged,
+                                                     verify_resource_group=verify_resource_group)
+                status, error = 'Unchanged' if skipped else 'Succeeded', None
+            except Exception as e:  # pylint: disable=broad-except
+                log.error(f'Action {action_name} failed for {manifest.name} in {resource_group_name}: {e}')
+                status, error = 'Failed', str(e)
+            result = {
+                'catalogItem': manifest.name,
+                'resourceGroup': resource_group_name,
+                'action': action_name,
+                'status': status,
+                'duration': round(time.perf_counter() - start, 2),
+                'error': error
+            }
+            log.info(f"{result['catalogItem']} ({result['resourceGroup']}): {result['status']} in {result['duration']}s")
+            return result
+
+    async def _run_all():
+        # deployments are awaited concurrently on one event loop, the executor
+        # only runs the blocking sdk calls (template compilation, submit and each poll)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            asyncio.get_running_loop().set_default_executor(executor)
+            semaphore = asyncio.Semaphore(concurrency)
+            return await asyncio.gather(*(_run(semaphore, m, rg) for m, rg in zip(manifests, resource_groups)))
+
+    results = asyncio.run(_run_all())
+
+    if (failed := sum(1 for r in results if r['status'] == 'Failed')):
+        log.warning(f'{failed} of {len(results)} catalog items failed')
+
+    return results
+
+
+def _run_action(cmd, resource_group_name: str, manifest: Manifest, action_name: str, action_parameters: dict,
+                skip_unchanged: bool = False, verify_resource_group: bool = False):
+    return asyncio.run(_run_action_async(cmd, resource_group_name, manifest, action_name, action_parameters,
+                                         skip_unchanged=skip_unchanged, verify_resource_group=verify_resource_group))
+
+
+async def _run_action_async(cmd, resource_group_name: str, manifest: Manifest, action_name: str,
+                            action_parameters: dict, skip_unchanged: bool = False, verify_resource_group: bool = False):
+    '''Run an action. Returns the result and True if the deployment was skipped because it was unchanged'''
+    from ._catalog import get_runner_type
+    from ._tracing import span
+    with span('action', action=action_name, catalogItem=manifest.name, runner=get_runner_type(manifest),
+              resourceGroup=resource_group_name):
+        if action_name.lower() == 'deploy':
+            from ._arm import deploy_arm_template_at_resource_group_async
+            log.info(f'Deploying environment {manifest.name} to {resource_group_name}...')
+            result, _ = await deploy_arm_template_at_resource_group_async(cmd, resource_group_name,
+                                                                          template_file=manifest.template_path,
+                                                                          parameters=action_parameters,
+                                                                          skip_unchanged=skip_unchanged,
+                                                                          verify_resource_group=verify_resource_group)
+            # the deployment result is only None when the deployment was skipped
+            return result, skip_unchanged and result is None
+
+    return None, False
+
+
+# -----------------------
+# ade-runner cache stats
+# ade-runner cache purge
+# -----------------------
+
+
+def ade_runner_cache_stats(cmd, name: str = None):
+    from ._cache import get_cache_stats
+    from ._terraform import PLUGIN_CACHE, get_plugin_cache_stats
+    stats = get_cache_stats(name)
+    for s in stats:
+        if s['name'] == PLUGIN_CACHE:  # the plugin cache is a directory tree of provider versions
+            s.update(get_plugin_cache_stats())
+    return stats
+
+
+def ade_runner_cache_purge(cmd, name: str = None):
+    from ._cache import purge_cache
+    purge_cache(name)
+
+
+def ade_runner_cache_warm(cmd, catalog: Path = None, catalog_items: List[Path] = None, manifests: List[Manifest] = None,
+                          concurrency: int = 4):
+    from ._bicep import build_bicep_file
+
+    def _build(manifest: Manifest):
+        try:
+            compiled_file, cached = build_bicep_file(cmd.cli_ctx, manifest.template_path)
+            status, error = ('Cached' if cached else 'Compiled') if compiled_file else 'Skipped', None
+        except Exception as e:  # pylint: disable=broad-except
+            log.error(f'Failed to compile {manifest.template_path}: {e}')
+            status, error = 'Failed', str(e)
+        return {'catalogItem': manifest.name, 'template': str(manifest.template_path), 'status': status, 'error': error}
+
+    bicep_manifests = [m for m in manifests if m.template_path.suffix.lower() == '.bicep']
+    log.info(f'Compiling {len(bicep_manifests)} bicep templates with concurrency {concurrency}')
+
+    # the manifests were loaded (and cached) by the validator
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(_build, bicep_manifests))
+
+
+# -----------------------
+# ade-runner validate
+# -----------------------
+
+
+def ade_runner_validate(cmd, catalog: Path = None, catalog_items: List[Path] = None, concurrency: int = None,
+                        report: Path = None):
+    import multiprocessing
+    import sys
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    from azure.cli.core.azclierror import ValidationError
+    from ._catalog import validate_catalog_item
+    from ._utils import atomic_write
+
+    concurrency = min(concurrency or os.cpu_count() or 1, len(catalog_items))
+    log.info(f'Validating {len(catalog_items)} catalog items with {concurrency} workers')
+
+    results = []
+    # spawn (not fork) so workers don't inherit the cli's threads and locks
+    with ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {executor.submit(validate_catalog_item, str(item)): item for item in catalog_items}
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"{result['status']:<6} {result['catalogItem']} ({result['duration']}s)", file=sys.stderr, flush=True)
+            for error in result['errors']:
+                print(f'       {error}', file=sys.stderr, flush=True)
+
+    # report in catalog order, not completion order
+    order = {str(item): i for i, item in enumerate(catalog_items)}
+    results.sort(key=lambda r: order[r['path']])
+
+    if report:
+        atomic_write(report, json.dumps(results, indent=4))
+        log.info(f'Wrote validation report to {report}')
+
+    if (failed := [r['catalogItem'] for r in results if r['status'] == 'Failed']):
+        raise ValidationError(f"{len(failed)} of {len(results)} catalog items failed validation: {', '.join(failed)}")
+
+    return results
+
+
+# -----------------------
+# ade-runner metrics merge
+# -----------------------
+
+
+def ade_runner_metrics_merge(cmd, files: List[Path] = None, outfile: Path = None):
+    from azure.cli.core.azclierror import FileOperationError
+    from ._metrics import merge_metrics
+    from ._utils import atomic_write
+
+    log.info(f'Merging {len(files)} metrics files')
+    try:
+        metrics = merge_metrics(files)
+    except (OSError, ValueError) as e:
+        raise FileOperationError(f'Unable to merge metrics files: {e}') from e
+
+    if not outfile:
+        print(metrics.to_text(), end='')
+        return None
+
+    atomic_write(outfile, metrics.to_text())
+    log.info(f'Wrote merged metrics to {outfile}')
+    return {
+        'files': len(files),
+        'metrics': len({metrics.get_family(name) for name, _ in metrics.samples}),
+        'samples': len(metrics.samples),
+        'outfile': str(outfile)
+    }
 
 
 # -----------------------
@@ -48,6 +228,7 @@ def ade_runner_run(cmd, environment_resource_group_name: str = None, runner: str
 
 
 def ade_runner_version(cmd):
+    from ._github import get_github_latest_release_version
     ext = show_extension(EXT_NAME)
     current_version = 'v' + ext['version']
     is_dev = 'extensionType' in ext and ext['extensionType'] == 'dev'
@@ -66,6 +247,7 @@ def ade_runner_version(cmd):
 
 
 def ade_runner_upgrade(cmd, version=None, prerelease=False):
+    from ._github import get_github_release
     ext = show_extension(EXT_NAME)
     current_version = 'v' + ext['version']
     log.info(f'Current version: {current_version}')
@@ -0,0 +1,248 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+# Offline micro-benchmarks for the runner's hot paths: terraform command parsing,
+# manifest validation, yaml loading, argument resolution and the run command
+# validator chain over synthetic catalogs of increasing size, plus the import
+# time of the command loader. Results are saved as json so runs from different
+# versions can be compared.
+#
+# usage: python tools/benchmark.py [--sizes 10 100 1000] [--filter manifest] [--output results.json]
+#        python tools/benchmark.py --compare baseline.json [--threshold 1.2]
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+EXT_NAME = 'ade-runner'
+EXT_NAME_CLEAN = EXT_NAME.replace('-', '_')
+
+path_root = Path(__file__).resolve().parent.parent
+path_src = path_root / EXT_NAME
+
+SIZES = [10, 100, 1000]
+REPEAT = 5
+# each measurement runs for at least this long (timeit.Timer.autorange uses 0.2s)
+MIN_SECONDS = 0.2
+# fail --compare if a benchmark is this many times slower than the baseline
+THRESHOLD = 1.2
+
+MANIFEST = '''name: {name}
+version: 1.0.{index}
+summary: Benchmark catalog item {index}
+description: A synthetic catalog item used by the runner benchmarks
+runner: ARM
+templatePath: azuredeploy.json
+'''
+
+TEMPLATE = '{"$schema": "https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#", ' \
+    '"contentVersion": "1.0.0.0", "parameters": {}, "resources": []}'
+
+
+def create_catalog(root: Path, size: int) -> Path:
+    catalog = root / f'catalog-{size}'
+    for i in range(size):
+        item = catalog / f'Item{i:05d}'
+        item.mkdir(parents=True)
+        (item / 'manifest.yaml').write_text(MANIFEST.format(name=item.name, index=i), encoding='utf-8')
+        (item / 'azuredeploy.json').write_text(TEMPLATE, encoding='utf-8')
+    return catalog
+
+
+def measure(func, repeat: int = REPEAT) -> dict:
+    '''Time func with timeit, returning the min, median and stdev time per call in microseconds'''
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < MIN_SECONDS:
+        number = max(1, int(number * MIN_SECONDS / max(elapsed, 1e-9)))
+    times = [t / number * 1e6 for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        'min': round(min(times), 3),
+        'median': round(statistics.median(times), 3),
+        'stdev': round(statistics.stdev(times), 3) if len(times) > 1 else 0,
+        'number': number,
+        'repeat': repeat
+    }
+
+
+def setup_environment(root: Path):
+    '''Point the runner's directories at a temporary directory and put a fake terraform on the path,
+    so the benchmarks run offline and don't touch the real storage or cache'''
+    for var in ('ADE_ACTION_STORAGE', 'ADE_ACTION_TEMP', 'ADE_ACTION_OUTPUT'):
+        (path := root / var.lower()).mkdir()
+        os.environ[var] = str(path)
+    os.environ['ADE_RUNNER'] = 'true'
+    # tracing and metrics are on by default in the runner
+    os.environ['ADE_RUNNER_TRACE'] = '0'
+    os.environ['ADE_RUNNER_METRICS'] = '0'
+    os.environ['ADE_ACTION_NAME'] = 'deploy'
+    os.environ['ADE_ACTION_PARAMETERS'] = '{}'
+    os.environ['ADE_ENVIRONMENT_RESOURCE_GROUP_NAME'] = 'benchmark-rg'
+
+    # _parse_command only resolves the terraform executable, it never runs it
+    (bin_dir := root / 'bin').mkdir()
+    (terraform := bin_dir / 'terraform').write_text('#!/bin/sh\n', encoding='utf-8')
+    terraform.chmod(0o755)
+    os.environ['PATH'] = os.pathsep.join([str(bin_dir), os.environ.get('PATH', '')])
+
+    sys.path.insert(0, str(path_src))
+
+
+def get_benchmarks(root: Path, sizes: list) -> dict:
+    '''Get the benchmarks by name. Imports the extension, so call after setup_environment'''
+    # pylint: disable=import-error, import-outside-toplevel, protected-access
+    from azext_ade_runner._catalog import get_catalog_items, get_manifest
+    from azext_ade_runner._data import Manifest, _validate_data_object
+    from azext_ade_runner._terraform import _parse_command
+    from azext_ade_runner._utils import get_yaml_file_contents, get_yaml_file_path
+    from azext_ade_runner._validators import _get_arg_or_env, ade_runner_run_command_validator
+
+    benchmarks = {}
+    cmd = SimpleNamespace(arguments={})
+
+    plan = ['plan', '-compact-warnings', '-detailed-exitcode', '-refresh=true', '-lock=true',
+            Path('/tmp/state.tfstate'), Path('/tmp/plan.tfplan'), '-var-file="vars.tfvars.json"']
+    benchmarks['terraform.parse_command'] = lambda: _parse_command(list(plan))
+
+    manifest = {'name': 'Item', 'version': '1.0.0', 'summary': 'Summary', 'description': 'Description',
+                'runner': 'ARM', 'templatePath': 'azuredeploy.json'}
+    manifest_path = root / 'manifest.yaml'
+    benchmarks['data.validate_data_object'] = \
+        lambda: _validate_data_object(Manifest, dict(manifest, file=manifest_path), manifest_path)
+    benchmarks['data.manifest'] = lambda: Manifest(dict(manifest), manifest_path)
+
+    ns = SimpleNamespace(action_name=None)
+    benchmarks['validators.get_arg_or_env'] = lambda: _get_arg_or_env(cmd, ns, 'action_name')
+
+    for size in sizes:
+        catalog = create_catalog(root, size)
+        items = get_catalog_items(catalog)
+        item = items[-1]
+        yaml_files = [get_yaml_file_path(i, 'manifest') for i in items]
+
+        benchmarks[f'catalog.get_catalog_items[{size}]'] = lambda c=catalog: get_catalog_items(c)
+        benchmarks[f'utils.get_yaml_file_path[{size}]'] = \
+            lambda i=items: [get_yaml_file_path(d, 'manifest') for d in i]
+        benchmarks[f'utils.get_yaml_file_contents[{size}]'] = \
+            lambda f=yaml_files: [get_yaml_file_contents(p) for p in f]
+        benchmarks[f'catalog.get_manifest[{size}]'] = lambda i=items: [get_manifest(d) for d in i]
+
+        def _run_validator(c=catalog, i=item):
+            ns = SimpleNamespace(catalog=str(c), catalog_item=str(i), manifest=None, action_name=None,
+                                 action_parameters=None, environment_resource_group_name=None)
+            ade_runner_run_command_validator(cmd, ns)
+
+        benchmarks[f'validators.run_command_validator[{size}]'] = _run_validator
+
+    return benchmarks
+
+
+def measure_import_time() -> dict:
+    '''Run import-time.py and return the command loader's import and load times in milliseconds'''
+    proc = subprocess.run([sys.executable, str(path_root / 'tools' / 'import-time.py'), '--json',
+                           '--budget-ms', '1000000'], capture_output=True, text=True, check=False)
+    if proc.returncode != 0:
+        print(f'WARNING: import-time.py failed: {proc.stderr[-1000:]}', file=sys.stderr)
+        return {}
+    results = json.loads(proc.stdout)
+    return {'import.command_loader': {'min': results['importMs'] * 1000, 'median': results['importMs'] * 1000,
+                                      'stdev': 0, 'number': 1, 'repeat': 1}}
+
+
+def get_git_commit() -> str:
+    proc = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=path_root, capture_output=True, text=True,
+                          check=False)
+    return proc.stdout.strip() or None
+
+
+def get_version() -> str:
+    with open(path_src / 'setup.py', 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('VERSION'):
+                return line.split('=', 1)[1].strip().strip('\'"')
+    return None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> bool:
+    '''Print the change in time of each benchmark from the baseline. The minimum is compared,
+    it is the least affected by other load on the machine. Returns True if any regressed'''
+    print(f"{'benchmark':<48} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    regressed = False
+    for name, current in results['results'].items():
+        if not (base := baseline['results'].get(name)):
+            print(f"{name:<48} {'-':>12} {current['min']:>10.1f}us {'new':>7}")
+            continue
+        ratio = current['min'] / base['min'] if base['min'] else 1
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{name:<48} {base['min']:>10.1f}us {current['min']:>10.1f}us {ratio:>6.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the runner micro-benchmarks')
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help='Synthetic catalog sizes')
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this')
+    parser.add_argument('--repeat', type=int, default=REPEAT, help='The number of measurements per benchmark')
+    parser.add_argument('--output', help='Save the results as json to this file')
+    parser.add_argument('--compare', help='Compare the results to a saved results json file')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='With --compare, fail if a benchmark is this many times slower than the baseline')
+    parser.add_argument('--skip-import', action='store_true', help='Skip measuring the command loader import time')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='ade-runner-benchmark-') as temp:
+        root = Path(temp)
+        setup_environment(root)
+        benchmarks = get_benchmarks(root, args.sizes)
+
+        results = {}
+        for name, func in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = measure(func, args.repeat)
+            print(f"{name:<48} {results[name]['median']:>12.1f}us", file=sys.stderr)
+
+    if not args.skip_import and (not args.filter or args.filter in 'import.command_loader'):
+        results.update(measure_import_time())
+
+    output = {
+        'version': get_version(),
+        'commit': get_git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(output, f, indent=4)
+        print(f'Saved results to {args.output}', file=sys.stderr)
+    elif not args.compare:
+        print(json.dumps(output, indent=4))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"Comparing to {baseline.get('version')} ({baseline.get('commit')})")
+        if compare(output, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,10 @@ pushd $extdir > /dev/null
     azdev style $EXT_NAME
     echo ""
 
+    echo "Checking $EXT_NAME extension import time"
+    python ./tools/import-time.py
+    echo ""
+
     echo "Building $EXT_NAME extension"
     azdev extension build $EXT_NAME --dist-dir ./release_assets
     echo ""
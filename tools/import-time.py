@@ -0,0 +1,152 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+# Measures the cost of loading the extension's command table and arguments
+# (what az does on every invocation, including tab completion) using
+# python -X importtime, and fails if it exceeds the budget or if modules
+# that should only load when a command runs are imported.
+#
+# usage: python tools/import-time.py [--budget-ms 40] [--json]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from pathlib import Path
+
+EXT_NAME = 'ade-runner'
+EXT_NAME_CLEAN = EXT_NAME.replace('-', '_')
+EXT_DIR_NAME = f'azext_{EXT_NAME_CLEAN}'
+
+# the cumulative import time (ms) of the extension modules loaded
+# by the command loader, not including azure.cli.core and knack
+BUDGET_MS = 40
+
+# modules that must only be imported when a specific command runs
+LAZY_MODULES = [
+    'requests',
+    'yaml',
+    f'{EXT_DIR_NAME}.custom',
+    f'{EXT_DIR_NAME}._arm',
+    f'{EXT_DIR_NAME}._bicep',
+    f'{EXT_DIR_NAME}._cache',
+    f'{EXT_DIR_NAME}._catalog',
+    f'{EXT_DIR_NAME}._data',
+    f'{EXT_DIR_NAME}._github',
+    f'{EXT_DIR_NAME}._metrics',
+    f'{EXT_DIR_NAME}._process',
+    f'{EXT_DIR_NAME}._terraform',
+    f'{EXT_DIR_NAME}._tfplan',
+    f'{EXT_DIR_NAME}._tracing',
+    f'{EXT_DIR_NAME}._utils',
+    f'{EXT_DIR_NAME}._validators',
+]
+
+MARKER = '#### ade-runner import-time ####'
+
+path_root = Path(__file__).resolve().parent.parent
+path_src = path_root / EXT_NAME
+
+# runs in a child process with -X importtime
+LOAD_SCRIPT = f'''
+import json, sys, time
+from azure.cli.core import get_default_cli
+cli = get_default_cli()
+before = set(sys.modules)
+sys.stderr.flush()
+sys.stderr.write('{MARKER}\\n')
+sys.stderr.flush()
+start = time.perf_counter()
+from {EXT_DIR_NAME} import COMMAND_LOADER_CLS
+loader = COMMAND_LOADER_CLS(cli_ctx=cli)
+loader.load_command_table(None)
+for command in list(loader.command_table):
+    loader.command_name = command
+    loader.load_arguments(command)
+elapsed = time.perf_counter() - start
+print(json.dumps({{'elapsed_ms': elapsed * 1000, 'modules': sorted(set(sys.modules) - before)}}))
+'''
+
+
+def parse_importtime(stderr: str):
+    '''Parse the -X importtime output after the marker into (module, self_us, cumulative_us, level) tuples'''
+    lines = stderr.splitlines()
+    lines = lines[lines.index(MARKER) + 1:] if MARKER in lines else lines
+
+    imports = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        if line.count('|') < 2:
+            continue
+        self_us, cumulative_us, name = line.split('|', 2)
+        self_us = int(self_us.replace('import time:', '').strip())
+        cumulative_us = int(cumulative_us.strip())
+        level = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), self_us, cumulative_us, level))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the import time of the extension command loader')
+    parser.add_argument('--budget-ms', type=float, default=BUDGET_MS, help='Fail if the import time exceeds this')
+    parser.add_argument('--json', action='store_true', help='Print the results as json')
+    args = parser.parse_args()
+
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.pathsep.join([str(path_src), env.get('PYTHONPATH', '')])
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', LOAD_SCRIPT],
+                          capture_output=True, text=True, env=env, check=False)
+
+    if proc.returncode != 0:
+        print(proc.stderr[-4000:], file=sys.stderr)
+        sys.exit(proc.returncode)
+
+    load = json.loads(proc.stdout.strip().splitlines()[-1])
+    imports = parse_importtime(proc.stderr)
+
+    # top level imports after the marker include everything the extension pulled in
+    total_ms = sum(cumulative for _, _, cumulative, level in imports if level == 0) / 1000
+    slowest = sorted(imports, key=lambda i: i[1], reverse=True)[:10]
+    eager = [m for m in LAZY_MODULES if m in load['modules']]
+
+    results = {
+        'importMs': round(total_ms, 2),
+        'loadMs': round(load['elapsed_ms'], 2),
+        'budgetMs': args.budget_ms,
+        'modules': len(load['modules']),
+        'eagerModules': eager,
+        'slowest': [{'module': m, 'selfUs': s, 'cumulativeUs': c} for m, s, c, _ in slowest]
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=4))
+    else:
+        print(f'Import time: {results["importMs"]} ms (budget {args.budget_ms} ms)')
+        print(f'Command table and arguments load time: {results["loadMs"]} ms')
+        print(f'Modules imported: {results["modules"]}')
+        print('')
+        print('Slowest imports (self time):')
+        for s in results['slowest']:
+            print(f'  {s["selfUs"]:>8} us  {s["module"]}')
+
+    failed = False
+
+    if eager:
+        print(f'\nERROR: modules imported while loading the command table: {", ".join(eager)}', file=sys.stderr)
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print(f'\nERROR: import time {total_ms:.2f} ms exceeds the budget of {args.budget_ms} ms', file=sys.stderr)
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
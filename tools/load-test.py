@@ -0,0 +1,429 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+# Runs concurrent deploy actions against a local fake ARM endpoint to measure the
+# deploy path (submit, polling, operation tracking and retries) under load without
+# an Azure subscription. The fake endpoint emulates resource groups, deployments
+# (PUT and long running operation polling with configurable latency and failures,
+# including ServiceUnavailable), deployment operations and tags.
+#
+# The actions run in process through the normal client factory. Only the login,
+# the resource manager endpoint and azure-core's https check for bearer tokens are
+# replaced, so requests go to the fake endpoint over http with a fake token.
+#
+# usage: python tools/load-test.py [--actions 50] [--concurrency 10] [--latency 3] [--unavailable-rate 0.1]
+#        [--trace trace.json] [--metrics metrics.prom]
+
+import argparse
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from types import SimpleNamespace
+
+EXT_NAME = 'ade-runner'
+EXT_NAME_CLEAN = EXT_NAME.replace('-', '_')
+
+path_root = Path(__file__).resolve().parent.parent
+path_src = path_root / EXT_NAME
+
+SUBSCRIPTION_ID = '00000000-0000-0000-0000-000000000000'
+TENANT_ID = '00000000-0000-0000-0000-000000000001'
+
+TEMPLATE = {
+    '$schema': 'https://schema.management.azure.com/schemas/2019-04-01/deploymentTemplate.json#',
+    'contentVersion': '1.0.0.0',
+    'parameters': {'name': {'type': 'string', 'defaultValue': 'loadtest'}},
+    'resources': []
+}
+
+MANIFEST = '''name: LoadTest
+version: 1.0.0
+summary: Load test catalog item
+description: An empty ARM template deployed to the fake ARM endpoint
+runner: ARM
+templatePath: azuredeploy.json
+'''
+
+# deployment operations are listed without the provider segment
+_DEPLOYMENT_PATTERN = re.compile(r'^/subscriptions/([^/]+)/resourcegroups/([^/]+)/(?:providers/'
+                                 r'microsoft\.resources/)?deployments/([^/]+)(/operations|/cancel)?$', re.IGNORECASE)
+_TAGS_PATTERN = re.compile(r'^/subscriptions/([^/]+)/resourcegroups/([^/]+)/providers/'
+                           r'microsoft\.resources/tags/default$', re.IGNORECASE)
+_RESOURCE_GROUP_PATTERN = re.compile(r'^/subscriptions/([^/]+)/resourcegroups/([^/]+)$', re.IGNORECASE)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeArm:
+    '''The state and behavior of the fake ARM endpoint'''
+
+    def __init__(self, latency: float, jitter: float, resources: int, unavailable_rate: float, failure_rate: float,
+                 throttle_rate: float, seed: int = None, retry_after: float = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.resources = resources
+        self.unavailable_rate = unavailable_rate
+        self.failure_rate = failure_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after  # sent on deployment submissions and polls of running deployments
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.deployments = {}  # (resource group, name): deployment
+        self.resource_groups = {}
+        self.requests = {}  # endpoint: count
+        self.submissions = {}  # resource group: number of deployments submitted
+        self.throttled = 0
+
+    def _count(self, endpoint: str):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+
+    def _throttle(self) -> bool:
+        if self.throttle_rate and self.random.random() < self.throttle_rate:
+            self.throttled += 1
+            return True
+        return False
+
+    def create_deployment(self, resource_group: str, name: str) -> dict:
+        with self.lock:
+            self._count('deployments.put')
+            self.submissions[resource_group] = self.submissions.get(resource_group, 0) + 1
+            roll = self.random.random()
+            outcome = 'ServiceUnavailable' if roll < self.unavailable_rate \
+                else 'Failed' if roll < self.unavailable_rate + self.failure_rate else 'Succeeded'
+            duration = max(0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            self.deployments[(resource_group.lower(), name)] = {
+                'resourceGroup': resource_group,
+                'name': name,
+                'start': time.monotonic(),
+                'created': datetime.now(timezone.utc),
+                'duration': duration,
+                'outcome': outcome
+            }
+        return self._deployment_body(resource_group, name, 'Accepted')
+
+    def _state(self, deployment: dict) -> str:
+        if time.monotonic() - deployment['start'] < deployment['duration']:
+            return 'Running'
+        return deployment['outcome'] if deployment['outcome'] in ('Succeeded', 'Canceled') else 'Failed'
+
+    def cancel_deployment(self, resource_group: str, name: str):
+        with self.lock:
+            self._count('deployments.cancel')
+            if not (deployment := self.deployments.get((resource_group.lower(), name))):
+                return 404, None
+            if self._state(deployment) != 'Running':
+                return 409, {'error': {'code': 'DeploymentCannotBeCancelled', 'message': f'{name} is not running'}}
+            # the deployment stops after its running operations finish
+            deployment['outcome'] = 'Canceled'
+            deployment['duration'] = time.monotonic() - deployment['start'] + min(1, self.latency)
+        return 204, None
+
+    def _deployment_body(self, resource_group: str, name: str, state: str, outcome: str = None) -> dict:
+        body = {
+            'id': f'/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{resource_group}/providers/'
+                  f'Microsoft.Resources/deployments/{name}',
+            'name': name,
+            'type': 'Microsoft.Resources/deployments',
+            'properties': {'provisioningState': state, 'timestamp': _now(), 'mode': 'Incremental', 'outputs': {}}
+        }
+        if state == 'Failed':
+            detail = {'code': 'ServiceUnavailable', 'message': 'The resource provider is temporarily unavailable.'} \
+                if outcome == 'ServiceUnavailable' else \
+                {'code': 'ResourceDeploymentFailure', 'message': 'The resource operation completed with a failure.'}
+            body['properties']['error'] = {'code': 'DeploymentFailed', 'details': [detail],
+                                           'message': 'At least one resource deployment operation failed.'}
+        return body
+
+    def get_deployment(self, resource_group: str, name: str):
+        with self.lock:
+            self._count('deployments.get')
+            if self._throttle():
+                return 429, None
+            if not (deployment := self.deployments.get((resource_group.lower(), name))):
+                return 404, None
+        state = self._state(deployment)
+        return 200, self._deployment_body(resource_group, name, state, deployment['outcome'])
+
+    def list_operations(self, resource_group: str, name: str):
+        with self.lock:
+            self._count('deployments.operations')
+            if not (deployment := self.deployments.get((resource_group.lower(), name))):
+                return 404, None
+        elapsed = time.monotonic() - deployment['start']
+        operations = []
+        for i in range(self.resources):
+            # resources finish one after another over the deployment's duration
+            finish = deployment['duration'] * (i + 1) / self.resources
+            done = elapsed >= finish
+            state = 'Running'
+            if done:
+                # failed deployments fail halfway, so with --fail-fast the runner cancels them
+                failed = deployment['outcome'] in ('Failed', 'ServiceUnavailable') and i == self.resources // 2
+                state = 'Failed' if failed else 'Succeeded'
+            operation = {
+                'id': f'{name}/operations/{i}',
+                'operationId': f'{i:016X}',
+                'properties': {
+                    'provisioningOperation': 'Create',
+                    'provisioningState': state,
+                    'timestamp': (deployment['created'] + timedelta(seconds=finish if done else 0)).isoformat(),
+                    'duration': f'PT{min(elapsed, finish):.1f}S',
+                    'statusCode': 'OK' if state == 'Succeeded' else None,
+                    'targetResource': {
+                        'id': f'/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{resource_group}/providers/'
+                              f'Microsoft.Web/sites/site{i}',
+                        'resourceType': 'Microsoft.Web/sites',
+                        'resourceName': f'site{i}'
+                    }
+                }
+            }
+            if state == 'Failed':
+                operation['properties']['statusMessage'] = {'status': 'Failed', 'error': {
+                    'code': deployment['outcome'], 'message': 'The resource operation failed.'}}
+            operations.append(operation)
+        # timestamps only change when an operation finishes, so the tracker records each change once
+        return 200, {'value': operations}
+
+    def resource_group(self, method: str, resource_group: str):
+        with self.lock:
+            self._count(f'resourcegroups.{method.lower()}')
+            if method == 'PUT':
+                self.resource_groups[resource_group.lower()] = resource_group
+        body = {'id': f'/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{resource_group}', 'name': resource_group,
+                'location': 'eastus', 'properties': {'provisioningState': 'Succeeded'}}
+        return (204 if method == 'HEAD' else 200), body
+
+    def tags(self, resource_group: str, body: dict):
+        with self.lock:
+            self._count('tags')
+        return 200, {'id': f'/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{resource_group}/providers/'
+                           'Microsoft.Resources/tags/default',
+                     'name': 'default', 'properties': (body or {}).get('properties', {'tags': {}})}
+
+
+def create_handler(arm: FakeArm):
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def _send(self, status: int, body: dict = None, retry_after: float = None):
+            data = json.dumps(body).encode('utf-8') if body is not None else b''
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if status == 429 or retry_after:
+                self.send_header('Retry-After', f'{retry_after or 1:g}')
+            self.end_headers()
+            if data and self.command != 'HEAD':
+                self.wfile.write(data)
+
+        def _read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            data = self.rfile.read(length) if length else b''
+            try:
+                return json.loads(data) if data else None
+            except ValueError:  # deployments are sent as jsonc by JsonCTemplatePolicy
+                return None
+
+        def _handle(self):
+            path = self.path.split('?', 1)[0].rstrip('/')
+            body = self._read_body()
+
+            if (match := _DEPLOYMENT_PATTERN.match(path)):
+                _, resource_group, name, action = match.groups()
+                if action == '/cancel':
+                    return self._send(*arm.cancel_deployment(resource_group, name))
+                if action:
+                    return self._send(*arm.list_operations(resource_group, name))
+                if self.command == 'PUT':
+                    return self._send(201, arm.create_deployment(resource_group, name), arm.retry_after)
+                status, deployment = arm.get_deployment(resource_group, name)
+                running = status == 200 and deployment['properties']['provisioningState'] == 'Running'
+                return self._send(status, deployment, arm.retry_after if running else None)
+
+            if (match := _TAGS_PATTERN.match(path)):
+                return self._send(*arm.tags(match.group(2), body))
+
+            if (match := _RESOURCE_GROUP_PATTERN.match(path)):
+                return self._send(*arm.resource_group(self.command, match.group(2)))
+
+            return self._send(404, {'error': {'code': 'NotFound', 'message': f'{self.command} {path}'}})
+
+        do_GET = do_PUT = do_PATCH = do_HEAD = do_POST = _handle
+
+    return Handler
+
+
+def percentile(values: list, percent: float) -> float:
+    '''Nearest rank percentile'''
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def setup_environment(root: Path):
+    '''Point the runner and az at a temporary directory so the load test doesn't touch real state'''
+    for var in ('ADE_ACTION_STORAGE', 'ADE_ACTION_TEMP', 'ADE_ACTION_OUTPUT'):
+        (path := root / var.lower()).mkdir()
+        os.environ[var] = str(path)
+    os.environ['ADE_RUNNER'] = 'true'
+    os.environ['AZURE_CONFIG_DIR'] = str(root / 'azure')
+    os.environ['AZURE_CORE_COLLECT_TELEMETRY'] = 'false'
+    sys.path.insert(0, str(path_src))
+
+
+def create_cli(endpoint: str):
+    '''Create an az cli context that sends resource manager requests to the fake endpoint with a fake token'''
+    # pylint: disable=import-outside-toplevel, protected-access
+    from azure.cli.core import get_default_cli
+    from azure.cli.core._profile import Profile
+    from azure.cli.core.profiles import get_sdk
+    from azure.core.credentials import AccessToken
+    from azure.core.pipeline.policies import BearerTokenCredentialPolicy
+
+    class FakeCredential:  # pylint: disable=too-few-public-methods
+        def get_token(self, *scopes, **kwargs):  # pylint: disable=unused-argument
+            return AccessToken('fake-token', int(time.time()) + 3600)
+
+    Profile.get_login_credentials = lambda self, **kwargs: (FakeCredential(), SUBSCRIPTION_ID, TENANT_ID)
+    Profile.get_subscription_id = lambda self, subscription=None: SUBSCRIPTION_ID
+    # the fake endpoint is http
+    BearerTokenCredentialPolicy._enforce_https = staticmethod(lambda request: None)
+
+    cli = get_default_cli()
+    cli.cloud.endpoints.resource_manager = endpoint
+
+    def get_models(*names, resource_type=None, **kwargs):  # pylint: disable=unused-argument
+        return get_sdk(cli, resource_type, *names, mod='models')
+
+    return SimpleNamespace(cli_ctx=cli, get_models=get_models)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the deploy path against a local fake ARM endpoint')
+    parser.add_argument('--actions', type=int, default=50, help='The number of deploy actions to run')
+    parser.add_argument('--concurrency', type=int, default=10, help='The number of actions to run concurrently')
+    parser.add_argument('--latency', type=float, default=3, help='Seconds each deployment runs for')
+    parser.add_argument('--jitter', type=float, default=1, help='Random +/- seconds added to the latency')
+    parser.add_argument('--resources', type=int, default=5, help='The number of operations in each deployment')
+    parser.add_argument('--unavailable-rate', type=float, default=0.1,
+                        help='The fraction of deployments that fail with ServiceUnavailable (retried)')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='The fraction of deployments that fail with a non-retryable error')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='The fraction of deployment polls answered with 429 and Retry-After')
+    parser.add_argument('--retry-after', type=float,
+                        help='Send Retry-After (seconds) on deployment submissions and polls of running deployments')
+    parser.add_argument('--poll-interval', type=float, help='Override the initial deployment poll interval (seconds)')
+    parser.add_argument('--fail-fast', action='store_true',
+                        help='Cancel deployments as soon as an operation fails (ADE_RUNNER_ARM_FAIL_FAST)')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible failures')
+    parser.add_argument('--json', action='store_true', help='Print the results as json')
+    parser.add_argument('--trace', help='Save a trace of the actions to this file (open it in https://ui.perfetto.dev)')
+    parser.add_argument('--metrics', help='Save the metrics of the actions to this file (prometheus text format)')
+    args = parser.parse_args()
+
+    # the runner traces and collects metrics by default, they are only kept if they're saved
+    # before the temp directory is removed
+    os.environ['ADE_RUNNER_TRACE'] = '1' if args.trace else '0'
+    os.environ['ADE_RUNNER_ARM_FAIL_FAST'] = '1' if args.fail_fast else '0'
+    os.environ['ADE_RUNNER_METRICS'] = '1' if args.metrics else '0'
+
+    arm = FakeArm(args.latency, args.jitter, args.resources, args.unavailable_rate, args.failure_rate,
+                  args.throttle_rate, seed=args.seed, retry_after=args.retry_after)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), create_handler(arm))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f'http://127.0.0.1:{server.server_address[1]}/'
+
+    with tempfile.TemporaryDirectory(prefix='ade-runner-load-test-') as temp:
+        root = Path(temp)
+        setup_environment(root)
+        cmd = create_cli(endpoint)
+
+        # pylint: disable=import-error, import-outside-toplevel
+        from azext_ade_runner import _arm
+        from azext_ade_runner._catalog import get_manifest
+        from azext_ade_runner.custom import ade_runner_run_batch
+
+        if args.poll_interval:
+            _arm.POLL_INTERVAL_MIN = args.poll_interval
+
+        item = root / 'catalog' / 'LoadTest'
+        item.mkdir(parents=True)
+        (item / 'manifest.yaml').write_text(MANIFEST, encoding='utf-8')
+        (item / 'azuredeploy.json').write_text(json.dumps(TEMPLATE), encoding='utf-8')
+        manifest = get_manifest(item)
+
+        resource_groups = [f'loadtest-rg-{i:04d}' for i in range(args.actions)]
+        print(f'Running {args.actions} deploy actions with concurrency {args.concurrency} against {endpoint}',
+              file=sys.stderr)
+
+        start = time.monotonic()
+        results = ade_runner_run_batch(cmd, manifests=[manifest] * args.actions, resource_groups=resource_groups,
+                                       action_name='deploy', action_parameters={}, concurrency=args.concurrency)
+        wall = time.monotonic() - start
+
+        if args.trace:
+            from azext_ade_runner._tracing import write_trace
+            write_trace(Path(args.trace).resolve())
+        if args.metrics:
+            from azext_ade_runner._metrics import write_metrics
+            write_metrics(Path(args.metrics).resolve())
+
+    server.shutdown()
+
+    durations = [r['duration'] for r in results]
+    succeeded = [r for r in results if r['status'] == 'Succeeded']
+    retries = sum(max(0, n - 1) for n in arm.submissions.values())
+
+    report = {
+        'actions': args.actions,
+        'concurrency': args.concurrency,
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'wall': round(wall, 2),
+        'throughput': round(len(results) / wall, 3) if wall else None,
+        'latency': {
+            'p50': percentile(durations, 50),
+            'p95': percentile(durations, 95),
+            'p99': percentile(durations, 99),
+            'max': max(durations) if durations else None
+        },
+        'retries': retries,
+        'throttled': arm.throttled,
+        'requests': dict(sorted(arm.requests.items()))
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"Actions: {report['actions']} ({report['succeeded']} succeeded, {report['failed']} failed) "
+              f"with concurrency {report['concurrency']}")
+        print(f"Wall time: {report['wall']}s, throughput: {report['throughput']} actions/s")
+        print(f"Action latency: p50 {report['latency']['p50']}s, p95 {report['latency']['p95']}s, "
+              f"p99 {report['latency']['p99']}s, max {report['latency']['max']}s")
+        print(f"Deployment retries (ServiceUnavailable): {report['retries']}, throttled polls: {report['throttled']}")
+        print('Requests: ' + ', '.join(f'{k} {v}' for k, v in report['requests'].items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# ------------------------------------
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+# ------------------------------------
+
+# Compares the cost of parsing catalog item manifests with azure cli's
+# get_file_yaml (pure python loader), and the extension's
+# get_yaml_file_contents with the pure python and libyaml loaders,
+# over a synthetic catalog of manifests.
+#
+# usage: python tools/manifest-parse.py [--count 2000] [--rounds 3] [--json]
+
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+
+EXT_NAME = 'ade-runner'
+EXT_NAME_CLEAN = EXT_NAME.replace('-', '_')
+
+path_root = Path(__file__).resolve().parent.parent
+path_src = path_root / EXT_NAME
+
+sys.path.insert(0, str(path_src))
+
+MANIFEST_TEMPLATE = '''# yaml-language-server: $schema=https://github.com/Azure/deployment-environments/releases/download/2022-11-11-preview/manifest.schema.json
+name: {name}
+version: 1.0.{index}
+summary: Catalog item {index} used by the manifest parse benchmark
+description: |
+  Deploys the resources for catalog item {index}.
+  Includes an app service plan, a web app with a staging slot, an application insights
+  component, a log analytics workspace, a key vault with access policies for the web app's
+  managed identity, and a storage account with containers for logs and artifacts.
+  Every resource is tagged with the environment name and the catalog item version.
+runner: {runner}
+templatePath: {template}
+'''
+
+
+def create_catalog(root: Path, count: int) -> list:
+    '''Create a catalog of count catalog items, alternating ARM, Bicep and Terraform templates'''
+    runners = [('ARM', 'azuredeploy.json'), ('ARM', 'main.bicep'), ('Terraform', 'main.tf')]
+    files = []
+    for i in range(count):
+        runner, template = runners[i % len(runners)]
+        item = root / f'Item{i:05d}'
+        item.mkdir(parents=True)
+        manifest = item / 'manifest.yaml'
+        manifest.write_text(MANIFEST_TEMPLATE.format(name=item.name, index=i, runner=runner, template=template),
+                            encoding='utf-8')
+        files.append(manifest)
+    return files
+
+
+def measure(load, files: list, rounds: int) -> dict:
+    '''Parse every manifest rounds times and return the median time per round and per manifest'''
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for f in files:
+            load(f)
+        times.append(time.perf_counter() - start)
+    median = statistics.median(times)
+    return {'seconds': round(median, 4), 'usPerManifest': round(median / len(files) * 1e6, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark manifest yaml parsing')
+    parser.add_argument('--count', type=int, default=2000, help='The number of manifests in the synthetic catalog')
+    parser.add_argument('--rounds', type=int, default=3, help='The number of times to parse the catalog')
+    parser.add_argument('--json', action='store_true', help='Print the results as json')
+    args = parser.parse_args()
+
+    import yaml
+    from azure.cli.core.util import get_file_yaml
+    from azext_ade_runner._utils import get_yaml_file_contents  # pylint: disable=import-error
+
+    paths = {
+        'get_file_yaml': lambda f: get_file_yaml(f, throw_on_empty=True),
+        'SafeLoader': lambda f: get_yaml_file_contents(f, loader=yaml.SafeLoader),
+    }
+    if hasattr(yaml, 'CSafeLoader'):
+        paths['CSafeLoader'] = lambda f: get_yaml_file_contents(f, loader=yaml.CSafeLoader)
+    else:
+        print('WARNING: pyyaml was not built with libyaml, CSafeLoader is not available', file=sys.stderr)
+
+    with tempfile.TemporaryDirectory(prefix='ade-runner-manifests-') as temp:
+        files = create_catalog(Path(temp), args.count)
+
+        # all paths must produce the same manifests
+        expected = [get_file_yaml(f) for f in files[:50]]
+        for name, load in paths.items():
+            if [load(f) for f in files[:50]] != expected:
+                print(f'ERROR: {name} parsed the manifests differently', file=sys.stderr)
+                sys.exit(1)
+
+        results = {name: measure(load, files, args.rounds) for name, load in paths.items()}
+
+    baseline = results['get_file_yaml']['seconds']
+    for r in results.values():
+        r['speedup'] = round(baseline / r['seconds'], 2) if r['seconds'] else None
+
+    if args.json:
+        print(json.dumps({'count': args.count, 'rounds': args.rounds, 'results': results}, indent=4))
+    else:
+        print(f'Parsed {args.count} manifests, median of {args.rounds} rounds')
+        for name, r in results.items():
+            print(f'  {name:<14} {r["seconds"]:>8.3f}s  {r["usPerManifest"]:>8.1f} us/manifest  {r["speedup"]:>5}x')
+
+
+if __name__ == '__main__':
+    main()